@@ -11,11 +11,15 @@ def heap(m, w):
 
     """
 
-    l = len(w)
-    f = lambda i,j: i < j and m[w[i]-1][w[j]-1] != 2
-    return Poset((range(l),f))
+    tops = {}
+    relations = []
+    for j in range(len(w)):
+        for s in tops:
+            if m[w[j]-1][s-1] != 2:
+                relations.append((tops[s],j))
+        tops[w[j]] = j
+    return Poset((range(len(w)),relations))
 
 def a(m,w):
-    l = heap(m,w).antichains()
-    return max([len(x) for x in l])
+    return heap(m,w).width()
 
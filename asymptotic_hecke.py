@@ -2,6 +2,13 @@ import itertools
 from collections import OrderedDict 
 from collections import defaultdict
 
+# Products in J_C split the same few words into dihedral segments over and
+# over, so the segments are kept in a table the first time they are computed.
+# The table is bounded like the normal form cache of fc.py, most recently used
+# last.
+segment_tables = OrderedDict()
+SEGMENT_CACHE_SIZE = 1 << 16
+
 def dihedral_string(s,t,l):
     r""" 
     Return the alternating tuple $(s,t,s,...)$ of length $l$. 
@@ -40,6 +47,28 @@ def numbers_from(a,n,d=-2):
     return tuple(a + d*i for i in xrange(n))
 
 
+def dihedral_lengths(m,k,l):
+    r"""
+    Return the lengths $n$ of the terms $t^{(n)}$ in $t_u*t_w$ for dihedral
+    $u=...sts$ and $w=sts...$ of lengths $k,l\ge 2$ with $m(s,t)=m$, as an
+    xrange; see dihedral_product.
+
+    EXAMPLES:
+
+        sage: list(dihedral_lengths(0,3,4))
+        sage: [6,4,2]
+
+        sage: list(dihedral_lengths(7,3,5))
+        sage: [5,3]
+    """
+
+    if m == 0 or k+l < m+1:
+        start, count = k+l-1, min(k,l)
+    else:
+        start, count = 2*m-k-l-1, m-max(k,l)
+    return xrange(start, start-2*count, -2)
+
+
 def dihedral_product(u,w,M):
     r""" 
     Compute $t_u*t_w$ in $J$ for dihedral sequences $u,w$.  
@@ -133,12 +162,7 @@ def dihedral_product(u,w,M):
 # Note the -1's below: we are assuming that the simple refelctions are labeled
 # starting from 1, instead of 0 like the rows/columns of M.
         m=M[u[0]-1][u[1]-1]
-        if m == 0:
-            S=numbers_from(k+l-1,min(k,l))
-        elif k+l<m+1:
-            S=numbers_from(k+l-1,min(k,l))
-        elif k+l>= m+1:
-            S=numbers_from(2*m-k-l-1,m-max(k,l))
+        S=dihedral_lengths(m,k,l)
         for l in S:
             d[dihedral_string(u[0],u[1],l)] += 1
     return d
@@ -215,34 +239,52 @@ def remove_first_dihedral_segment(t):
 
 def dihedral_segments(t):
     r""" 
-    Return the dihedral segments of $t$ in a list.
+    Return the dihedral segments of $t$ in a tuple.
     
     INPUT:
     
-    - "t" -- any nonemtpy tuple
+    - "t" -- any tuple
 
     OUTPUT:
 
-    - the list of the dihedral segments of $t$
+    - the tuple of the dihedral segments of $t$, empty if $t$ is empty
 
     EXAMPLES:
 
+        sage: dihedral_segments(())
+        sage: ()
+
         sage: dihedral_segments((1,))
-        sage: [(1,)]
+        sage: ((1,),)
 
         sage: dihedral_segments((1,2,1,2))
-        sage: [(1,2,1,2)]
+        sage: ((1,2,1,2),)
 
         sage: dihedral_segments((1,2,1,3,2,3,4,3,4,1))
-        sage: [(1,2,1),(1,3),(3,2,3),(3,4,3,4),(4,1)]
+        sage: ((1,2,1),(1,3),(3,2,3),(3,4,3,4),(4,1))
     """
    
-    segment_list = []
-    remainder = t
-    while len(remainder) != 0:
-        segment_list.append(first_dihedral_segment(remainder))
-        remainder = remove_first_dihedral_segment(remainder)
-    return segment_list
+    if not t:
+        return ()
+    if t in segment_tables:
+        segments = segment_tables.pop(t)
+    else:
+        segment_list = []
+        start = 0
+        while True:
+            pair = t[start:start+2]
+            end = start + 1
+            while end < len(t) and t[end] in pair:
+                end += 1
+            segment_list.append(t[start:end])
+            if end == len(t):
+                break
+            start = end - 1     # consecutive segments share a letter
+        segments = tuple(segment_list)
+        if len(segment_tables) >= SEGMENT_CACHE_SIZE:
+            segment_tables.popitem(last=False)
+    segment_tables[t] = segments
+    return segments
 
 
 def left_mult_by_dihedral(u,w,M):
@@ -290,16 +332,7 @@ def left_mult_by_dihedral(u,w,M):
    
     if u[-1] != w[0]:
         return {}
-    elif is_dihedral(w):    # this includes the case len(w)=1
-        return dihedral_product(u,w,M)
-    else: 
-        head_of_w=first_dihedral_segment(w)
-        body_of_w=remove_first_dihedral_segment(w)  # guaranteed to be nonempty
-        new_heads=dihedral_product(u,head_of_w,M) 
-        d = defaultdict(int)
-        for key in new_heads:
-            d[key[:-1] + body_of_w] += new_heads[key]
-        return d
+    return expanded_terms(segment_left_mult(segments_of(u)[0],segments_of(w),M))
 
 def t_basis_product(u,w,M):
     r""" 
@@ -324,7 +357,8 @@ def t_basis_product(u,w,M):
 
     Break $u$ into its dihedral segments $d_n, ..., d_2, d_1$. Multiply $t_w$ 
     by $t_{d_1}$ on the left, then multiply the result on the left by
-    $t_{d_2}$, then $t_{d_3}$, etc.
+    $t_{d_2}$, then $t_{d_3}$, etc. This is done by segment_product on
+    compressed codes, which are only expanded at the end.
 
 
     EXAMPLES:
@@ -344,22 +378,8 @@ def t_basis_product(u,w,M):
     if u[-1] != w[0]:
         return 0
     else:
-        segments = dihedral_segments(u)
-        n=len(segments)
-        d = defaultdict(int)
-        d[w] = 1
-        while n>0:
-            x = segments[-1]
-            new_d = defaultdict(int)
-            for term in d:
-                new_terms = left_mult_by_dihedral(x,term,M)
-                for new_term in new_terms:
-                    new_d[new_term] += new_terms[new_term] * d[term]
-            d = new_d
-            segments=segments[:-1]
-            n=n-1
-        # return d
-        return OrderedDict(sorted(d.items()))
+        d = segment_product(segments_of(u),segments_of(w),M)
+        return OrderedDict(sorted(expanded_terms(d).items()))
 
 def print_t_basis_product(u,w,M):
     r""" 
@@ -450,10 +470,10 @@ def arbitrary_product(d1,d2,M):
     d = defaultdict(int)
     for u in d1:
         for w in d2:
-            dd = t_basis_product(u,w,M)
+            dd = segment_product(segments_of(u),segments_of(w),M)
             for summand in dd:
                 d[summand] += dd[summand] * d1[u] * d2[w]
-    return d
+    return expanded_terms(d)
 
 def print_arbitrary_product(d1,d2,M):
     r"""
@@ -506,6 +526,281 @@ def print_arbitrary_product(d1,d2,M):
         print d[key], '*', key
 
 
+""" run-length coded elements of $J_C$ """
+
+def segments_of(w):
+    r"""
+    Return the run-length code of a subregular element: the tuple of its
+    dihedral segments, each written as a triple $(s,t,l)$ for the alternating
+    string $(s,t,s,...)$ of length $l$. A single generator $s$ is coded as
+    $((s,s,1),)$.
+
+    In a compressed code, a length may also be a triple (start,stop,step)
+    standing for the lengths in xrange(start,stop,step); the code then stands
+    for the sum of the elements with all these lengths. Such sums come out of
+    segment_left_mult, see there.
+
+    EXAMPLES:
+
+        sage: segments_of((1,3,1,3,1,3,2,1))
+        sage: ((1,3,6),(3,2,2),(2,1,2))
+
+        sage: segments_of((2,))
+        sage: ((2,2,1),)
+    """
+
+    if len(w) == 1:
+        return ((w[0],w[0],1),)
+    return tuple((x[0],x[1],len(x)) for x in dihedral_segments(w))
+
+
+def word_of(segments):
+    r"""
+    Return the tuple coded by a tuple of dihedral segments; the inverse of
+    segments_of.
+
+    EXAMPLES:
+
+        sage: word_of(((1,3,6),(3,2,2),(2,1,2)))
+        sage: (1,3,1,3,1,3,2,1)
+    """
+
+    word = dihedral_string(*segments[0])
+    for x in segments[1:]:
+        word = word + dihedral_string(*x)[1:]
+    return word
+
+
+def lengths_of(l):
+    r"""
+    Return the lengths coded by the length $l$ of a segment: $l$ itself, or
+    the xrange of an arithmetic progression (start,stop,step).
+
+    EXAMPLES:
+
+        sage: list(lengths_of((7,1,-2)))
+        sage: [7,5,3]
+    """
+
+    return xrange(*l) if isinstance(l,tuple) else (l,)
+
+
+def progression(start,count):
+    r"""
+    Return the compressed length for start, start-2, ..., start-2*(count-1),
+    which is just start if count is 1.
+    """
+
+    return start if count == 1 else (start,start-2*count,-2)
+
+
+def expanded(code):
+    r"""
+    Return the codes of the elements summed in a compressed code.
+
+    EXAMPLES:
+
+        sage: list(expanded(((1,2,2),(2,3,(5,1,-2)))))
+        sage: [((1,2,2),(2,3,5)),((1,2,2),(2,3,3))]
+    """
+
+    return itertools.product(*[[(s,t,n) for n in lengths_of(l)]
+                               for (s,t,l) in code])
+
+
+def expanded_terms(d):
+    r"""
+    Return a dictionary from compressed codes to coefficients as a dictionary
+    from tuples to coefficients, leaving out the coefficients that cancel.
+    """
+
+    terms = defaultdict(int)
+    for key in d:
+        for code in expanded(key):
+            terms[word_of(code)] += d[key]
+    for word in [word for word in terms if terms[word] == 0]:
+        del terms[word]
+    return terms
+
+
+def last_letter(x):
+    r"""
+    Return the last letter of the dihedral segment $x=(s,t,l)$; the lengths
+    in a compressed segment all have the same parity.
+    """
+
+    return x[0] if lengths_of(x[2])[0] % 2 else x[1]
+
+
+def segment_left_mult(x,w,M):
+    r"""
+    Return $t_x*t_w$ for a dihedral segment $x$ and a coded element $w$; the
+    run-length counterpart of left_mult_by_dihedral. Only $x$ and the first
+    segment of $w$ are looked at, and the rest of $w$ is reused as it is.
+
+    When $x$ and the first segment of $w$ merge, the lengths of the new first
+    segment form the progression dihedral_lengths(m,k,l), which has min(k,l)
+    terms when $m=\infty$; it is kept as one compressed key, apart from the
+    length 1. Compressed segments of $x$ and $w$ are allowed, but then every
+    pair of lengths $(k_1,l_1)$ they stand for gives its own progression.
+    The sum of these progressions has coefficients that change along it, so
+    it is not one progression with a coefficient, and it is left as one key
+    per pair. So the compression only lasts for one product: the powers
+    $x^2,x^3,x^4$ of $x=t_{sts...}$ of length 41 with $m(s,t)=\infty$ have
+    2, 42 and 62 keys for 41, 61 and 81 terms.
+
+    OUTPUT:
+
+    - a dictionary whose keys are codes of elements and whose values are
+      the corresponding coefficients in $t_x*t_w$.
+
+    EXAMPLES:
+
+        sage: M=[[1,4,7],[4,1,0],[7,0,1]]
+
+        sage: segment_left_mult((1,3,4),((3,1,5),(3,2,2),(2,1,2)),M)
+        sage: {((1,3,(4,0,-2)),(3,2,2),(2,1,2)):1}
+
+        sage: segment_left_mult((2,3,(7,1,-2)),((2,3,4),),M)
+        sage: {((2,3,(10,2,-2)),):1,((2,3,(8,0,-2)),):1,((2,3,(6,0,-2)),):1}
+    """
+
+    s, t, k = x
+    p, q, l = w[0]
+    if last_letter(x) != p:
+        return {}
+    elif k == 1:
+        return {w:1}
+    elif l == 1:
+        return {(x,):1}
+    elif (t if lengths_of(k)[0] % 2 else s) != q:   # the letter before the last one of x
+        return {(x,)+w:1}
+    d = defaultdict(int)
+    rest = w[1:]
+    for k1 in lengths_of(k):
+        for l1 in lengths_of(l):
+            S = dihedral_lengths(M[s-1][t-1],k1,l1)
+            count = len(S)
+            if count and S[-1] == 1:
+                d[rest if rest else ((s,s,1),)] += 1
+                count -= 1
+            if count:
+                d[((s,t,progression(S[0],count)),)+rest] += 1
+    return d
+
+
+def segment_product(u,w,M):
+    r"""
+    Return $t_u*t_w$ for coded elements $u,w$, multiplying $t_w$ on the left
+    by the segments of $u$ from the last one to the first, as in
+    t_basis_product. The cost depends on the numbers of segments of $u$ and
+    $w$, not on their lengths.
+
+    EXAMPLES:
+
+        sage: M=[[1,4,7],[4,1,0],[7,0,1]]
+
+        sage: segment_product(((1,2,2),(2,3,3)),((2,3,4),(3,1,2)),M)
+        sage: {((1,2,2),(2,3,(6,0,-2)),(3,1,2)):1}
+    """
+
+    if last_letter(u[-1]) != w[0][0]:
+        return {}
+    d = {w:1}
+    for x in reversed(u):
+        new_d = defaultdict(int)
+        for term in d:
+            new_terms = segment_left_mult(x,term,M)
+            for new_term in new_terms:
+                new_d[new_term] += new_terms[new_term] * d[term]
+        d = new_d
+    return d
+
+
+class JCElement(object):
+    r"""
+    An element of $J_C$, stored as the compressed codes of its $t$-basis
+    elements (see segments_of) and, in a parallel list, their coefficients.
+    The codes are only expanded by terms and for printing.
+
+    Raw tuples grow with the dihedral exponents, and every product slices
+    and concatenates them; codes only grow with the number of segments, and
+    a product only changes the segments at the boundary. A product of
+    elements with plain lengths keeps the lengths of a merged segment as one
+    compressed key, but a further product by such a key gives a key for each
+    of its lengths (see segment_left_mult), so over repeated products the
+    number of keys grows like the number of terms.
+
+    INPUT:
+
+    - "d" -- a dictionary whose keys are tuples representing $t$-basis
+             elements, as in arbitrary_product, or their codes if "coded"
+             is True
+    - "M" -- the Coxeter matrix for an ambient Coxeter system $(W,S)$, with
+             0 for $m(s,t)=\infty$
+
+    EXAMPLES:
+
+        sage: M=[[1,4,7],[4,1,0],[7,0,1]]
+
+        sage: x = JCElement({(2,3):2, (1,3,1,3):4}, M)
+        sage: x * JCElement({(3,1,3,1,3,2):5}, M)
+        sage: 20*t_(1,3,1,3,2) + 20*t_(1,3,2) + 10*t_(2,3,1,3,1,3,2)
+
+        sage: x.keys
+        sage: [((2,3,2),), ((1,3,4),)]
+    """
+    __slots__ = ('M', 'keys', 'coefficients')
+
+    def __init__(self, d, M, coded=False):
+        self.M = M
+        self.keys = []
+        self.coefficients = []
+        for key in d:
+            if d[key] != 0:
+                self.keys.append(key if coded else segments_of(key))
+                self.coefficients.append(d[key])
+
+    def terms(self):
+        r"""
+        Return the element as a dictionary from tuples to coefficients,
+        sorted like the output of t_basis_product.
+        """
+        d = defaultdict(int)
+        for key, c in zip(self.keys, self.coefficients):
+            d[key] += c
+        return OrderedDict(sorted(expanded_terms(d).items()))
+
+    def __add__(self, other):
+        d = defaultdict(int)
+        for x in (self, other):
+            for key, c in zip(x.keys, x.coefficients):
+                d[key] += c
+        return JCElement(d, self.M, coded=True)
+
+    def __mul__(self, other):
+        d = defaultdict(int)
+        for u, a in zip(self.keys, self.coefficients):
+            for w, b in zip(other.keys, other.coefficients):
+                dd = segment_product(u,w,self.M)
+                for key in dd:
+                    d[key] += dd[key] * a * b
+        return JCElement(d, self.M, coded=True)
+
+    def __eq__(self, other):
+        return self.terms() == other.terms()
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        terms = self.terms()
+        if not terms:
+            return '0'
+        return ' + '.join('{}*t_{}'.format(terms[key], key).replace(' ', '')
+                          for key in terms)
+
+
 ###############################################################################
 
 """
@@ -3,14 +3,152 @@ This file contains various sorts of conversions that are useful for dealing
 with words in Coxeter groups.
 """
 
+import numbers
+
+""" packed words """
+
+# letters 1, ..., 9 <--> digits '1', ..., '9'; every other byte is fixed
+_FROM_DIGITS = bytes(bytearray(i - 48 if 48 < i < 58 else i for i in range(256)))
+_TO_DIGITS = bytes(bytearray(i + 48 if 0 < i < 10 else i for i in range(256)))
+_DIGIT_LETTERS = bytes(bytearray(range(1,10)))
+
+class Word(bytes):
+    r"""
+    A word in the generators 1, 2, ..., 255 of a Coxeter group, packed with one
+    letter per byte.
+
+    Words used to be stored as integers (231 for (2,3,1)), which breaks down
+    as soon as a generator has two digits. A Word hashes and compares like the
+    underlying bytes, with the hash computed once and cached, so it is a cheap
+    dictionary key at any rank. Words are ordered first by length and then
+    letter by letter, and are printed as digits whenever every letter is at
+    most 9, which agrees with the old integer words; letters of larger words
+    are separated by dots.
+
+    EXAMPLES:
+        sage: Word(231)
+        sage: 231
+
+        sage: Word((2,3,1)) == Word(231)
+        sage: True
+
+        sage: Word((1,10,3))
+        sage: 1.10.3
+
+        sage: int(Word((2,3,1)))
+        sage: 231
+
+        sage: (Word((1,3)) + (2,)).letters()
+        sage: (1, 3, 2)
+
+        sage: Word((2,3,1))[1:]
+        sage: 31
+
+        sage: loads(dumps(Word((1,10,3)),0))
+        sage: 1.10.3
+    """
+    __slots__ = ()
+
+    def __new__(cls, w=b''):
+        if type(w) is cls:
+            return w
+        if isinstance(w, numbers.Integral):
+            w = str(w).encode('ascii').translate(_FROM_DIGITS)
+        elif not isinstance(w, bytes):
+            w = bytes(bytearray(w))
+        return bytes.__new__(cls, w)
+
+    def letters(self):
+        """ Return the letters of the word as a tuple of integers. """
+        return tuple(bytearray(self))
+
+    def __repr__(self):
+        if not self.translate(None, _DIGIT_LETTERS):
+            return self.translate(_TO_DIGITS).decode('ascii')
+        return '.'.join(map(str, bytearray(self)))
+
+    __str__ = __repr__
+
+    def __int__(self):
+        """ Return the word as a legacy integer, if all letters are at most 9. """
+        if not self or self.translate(None, _DIGIT_LETTERS):
+            raise ValueError("%r has no integer form" % self)
+        return int(self.translate(_TO_DIGITS))
+
+    def __add__(self, other):
+        # not bytes(self), which is str(self), i.e. the digits, in Python 2
+        return Word(bytes.__add__(self, Word(other)))
+
+    def __getitem__(self, i):
+        """ A slice of a Word is a Word; an index is as for bytes. """
+        if isinstance(i, slice):
+            return Word(bytes.__getitem__(self, i))
+        return bytes.__getitem__(self, i)
+
+    def __getslice__(self, i, j):
+        # Python 2 slices w[i:j] through __getslice__, not __getitem__
+        return Word(bytes.__getslice__(self, i, j))
+
+    def __reduce__(self):
+        # by letters, since the bytes of a Word are its digits in Python 2
+        return (Word, (self.letters(),))
+
+    def __lt__(self, other):
+        return len(self) < len(other) or (len(self) == len(other) and
+                                          bytes.__lt__(self, other))
+
+    def __le__(self, other):
+        return len(self) < len(other) or (len(self) == len(other) and
+                                          bytes.__le__(self, other))
+
+    def __gt__(self, other):
+        return len(self) > len(other) or (len(self) == len(other) and
+                                          bytes.__gt__(self, other))
+
+    def __ge__(self, other):
+        return len(self) > len(other) or (len(self) == len(other) and
+                                          bytes.__ge__(self, other))
+
+def words_from_integers(l):
+    """ Convert a list of legacy integer words to Words, in one pass.
+
+    EXAMPLES:
+        sage: words_from_integers([13, 213, 1213])
+        sage: [13, 213, 1213]
+    """
+    l = list(l)
+    if not l:
+        return []
+    s = ' '.join(map(str, l)).encode('ascii').translate(_FROM_DIGITS)
+    return [Word(w) for w in s.split(b' ')]
+
+def words_to_integers(l):
+    """ Convert a list of Words with letters at most 9 to legacy integers, in
+    one pass.
+
+    EXAMPLES:
+        sage: words_to_integers([Word((1,3)), Word((2,1,3))])
+        sage: [13, 213]
+    """
+    l = [Word(w) for w in l]
+    if not l:
+        return []
+    s = b'\x00'.join(l)
+    if s.translate(None, _DIGIT_LETTERS + b'\x00') or not all(l):
+        raise ValueError("some word has no integer form")
+    return [int(w) for w in s.translate(_TO_DIGITS).split(b'\x00')]
+
+
+""" conversions between integers, lists, tuples and words """
+
 def word_to_list(w):
-    """ Return the digits in a word (number) w as a list of integers.
+    """ Return the letters in a word w as a list of integers.
 
     EXAMPLES:
         sage: word_to_list(231)
         sage: [2,3,1]
     """
-    return  [int(i) for i in str(w)]
+    return list(bytearray(Word(w)))
 
 def word_to_tuple(w):
     """ Like word_to_list, but to tuples.
@@ -19,10 +157,10 @@ def word_to_tuple(w):
         sage: word_to_tuple(231)_
         sage: (2,3,1)
     """
-    return tuple(int(i) for i in str(w))
+    return tuple(bytearray(Word(w)))
 
 def list_or_tuple_to_word(l):
-    """ Concatenate the digits in a list or tuple to form a word. 
+    """ Pack the letters in a list or tuple into a Word. 
 
     EXAMPLES:
         sage: list_or_tuple_to_word([2,3,1])
@@ -31,7 +169,7 @@ def list_or_tuple_to_word(l):
         sage: list_or_tuple_to_word((2,3,1)) 
         sage: 231
     """
-    return int(''.join(map(str,l)))
+    return Word(l)
 
 def convert_element(n,w):
     """ Change a word digit-wise by the 1-n, 2-(n-1), ... .
@@ -49,8 +187,7 @@ def convert_element(n,w):
       -- We will get cell data from Coxeter, convert them using this map to
          words for Sage, then compute minimal coset representatives using Sage.
     """
-    t=tuple(n+Integer(1)-int(i) for i in str(w))
-    return int(''.join(map(str,t)))
+    return Word(n+1-i for i in word_to_tuple(w))
 
 def convert_cell(n,cell):
     """ Apply convert_element to every element in a cell. 
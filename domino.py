@@ -0,0 +1,359 @@
+import itertools
+from collections import defaultdict
+from conversions import Word
+from rsk import sorted_cells, format_cells
+
+""" Kazhdan-Lusztig cells of type B_n (equal parameters) from Garfinkle's
+domino insertion, without the Hecke algebra.
+
+As in KL_cells/B<n>, the generator 1 is the one with the strong bond: a word
+a_1 ... a_k is the signed permutation s_{a_1} ... s_{a_k} of {1, ..., n} in
+one-line notation, where s_1 changes the sign of the first entry and s_i,
+i >= 2, exchanges the entries i-1 and i. Inserting the entries gives a pair
+(P, Q) of domino tableaux with a square labelled 0 at (1,1). Elements with
+the same Q lie in the same left cell, and two left cells are the same when
+their recording tableaux differ by moving through non-core open cycles, the
+squares (i,j) with i+j odd being fixed. Right cells come from P in the same
+way, and the 2-sided cells are generated by left and right cells. """
+
+
+""" words and signed permutations """
+
+def word_to_signed_permutation(w,n):
+    """
+    Return the signed permutation s_{a_1} ... s_{a_k} of {1, ..., n} for a
+    word w = a_1 ... a_k, in one-line notation.
+
+    EXAMPLE:
+        sage: word_to_signed_permutation(121,2)
+        sage: (-2, -1)
+    """
+    p = list(range(1,n+1))
+    for s in (Word(w).letters() if w else ()):
+        if s == 1:
+            p[0] = -p[0]
+        else:
+            p[s-2], p[s-1] = p[s-1], p[s-2]
+    return tuple(p)
+
+def signed_permutation_to_word(p):
+    """
+    Return the lexicographically smallest reduced word of a signed
+    permutation in one-line notation, as in KL_cells.
+
+    NOTE:
+    The left descents of p are the right descents of its inverse u: 1 if
+    u(1) < 0, and i >= 2 if u(i-1) > u(i).
+
+    EXAMPLE:
+        sage: signed_permutation_to_word((2,-1))
+        sage: 12
+    """
+    u = [0]*len(p)
+    for j in range(len(p)):
+        u[abs(p[j])-1] = j+1 if p[j] > 0 else -j-1
+    word = []
+    i = 1
+    while i <= len(u):
+        if i == 1 and u[0] < 0:
+            word.append(1)
+            u[0] = -u[0]
+        elif i > 1 and u[i-2] > u[i-1]:
+            word.append(i)
+            u[i-2], u[i-1] = u[i-1], u[i-2]
+            i = i-1
+        else:
+            i = i+1
+    return Word(word)
+
+
+""" domino insertion """
+
+def dominoes(T):
+    """
+    Return a dictionary sending each positive label of a domino tableau to
+    its two squares (i,j), indexed from 1.
+
+    EXAMPLE:
+        sage: dominoes(((0, 1, 1), (2,), (2,)))
+        sage: {1: [(1, 2), (1, 3)], 2: [(2, 1), (3, 1)]}
+    """
+    D = defaultdict(list)
+    for i in range(len(T)):
+        for j in range(len(T[i])):
+            if T[i][j]:
+                D[T[i][j]].append((i+1,j+1))
+    return D
+
+def domino_insert(T,x):
+    """
+    Insert the entry x of a signed permutation into a domino tableau T, given
+    as a tuple of rows of labels, and return the new tableau. The domino
+    labelled |x| goes at the end of the first row if x > 0 and of the first
+    column if x < 0; the dominoes with larger labels are then bumped in
+    increasing order.
+
+    NOTE:
+    Let delta be the domino by which the squares with labels smaller than y
+    have grown. The domino of y stays if it misses delta, moves to the next
+    row or column if it is delta, and otherwise becomes the rest of the 2x2
+    square it spans together with delta.
+
+    EXAMPLE:
+        sage: domino_insert(((0, 1, 1),), -2)
+        sage: ((0, 1, 1), (2,), (2,))
+        sage: domino_insert(((0, 2, 2),), 1)
+        sage: ((0, 1, 1), (2, 2))
+    """
+    k = abs(x)
+    old = [sum(1 for l in row if l < k) for row in T] + [0, 0, 0]
+    cur = list(old)
+    new = {}
+    for i in range(len(T)):
+        for j in range(old[i]):
+            new[(i+1,j+1)] = T[i][j]
+    D = dominoes(T)
+    if x > 0:
+        D[k] = [(1,cur[0]+1), (1,cur[0]+2)]
+    else:
+        r = cur.index(0)
+        D[k] = [(r+1,1), (r+2,1)]
+    for y in sorted(l for l in D if l >= k):
+        cells = D[y]
+        if y > k:
+            delta = set((i+1,j+1) for i in range(len(cur))
+                        for j in range(old[i],cur[i]))
+            meet = delta.intersection(cells)
+            for (i,j) in cells:
+                old[i-1] = max(old[i-1],j)
+            if len(meet) == 2:
+                (i,j), (i2,j2) = cells
+                if i == i2:
+                    cells = [(i+1,cur[i]+1), (i+1,cur[i]+2)]
+                else:
+                    r = cur.index(j)
+                    cells = [(r+1,j+1), (r+2,j+1)]
+            elif meet:
+                square = set(cells) | delta
+                i = min(c[0] for c in square)
+                j = min(c[1] for c in square)
+                cells = sorted(set([(i,j), (i+1,j), (i,j+1), (i+1,j+1)]) - delta)
+        for (i,j) in cells:
+            new[(i,j)] = y
+            cur[i-1] = max(cur[i-1],j)
+    return tuple(tuple(new[(i+1,j+1)] for j in range(cur[i]))
+                 for i in range(len(cur)) if cur[i])
+
+def domino_tableaux(p):
+    """
+    Return the insertion and recording domino tableaux (P, Q) of a signed
+    permutation in one-line notation.
+
+    EXAMPLE:
+        sage: domino_tableaux((2,-1))
+        sage: (((0, 2, 2), (1,), (1,)), ((0, 1, 1), (2,), (2,)))
+    """
+    P = ((0,),)
+    Q = {(1,1): 0}
+    for j in range(len(p)):
+        P2 = domino_insert(P,p[j])
+        for i in range(len(P2)):
+            for c in range(len(P[i]) if i < len(P) else 0, len(P2[i])):
+                Q[(i+1,c+1)] = j+1
+        P = P2
+    return P, tuple(tuple(Q[(i+1,j+1)] for j in range(len(P[i])))
+                    for i in range(len(P)))
+
+
+""" moving through cycles """
+
+def moved_domino(T,k,cells):
+    """
+    Return the domino D'(k) of Garfinkle: the other domino through the fixed
+    square of the domino of k which keeps T a tableau.
+
+    NOTE:
+    Besides its fixed square (i,j), D'(k) contains a neighbour on the
+    opposite side of the diagonal, chosen by comparing k with the label of
+    (i-1,j+1) or (i+1,j-1); squares off the top or the left count as
+    smaller, and squares outside T as larger.
+    """
+    f = [c for c in cells if (c[0]+c[1]) % 2][0]
+    v = [c for c in cells if c != f][0]
+    i, j = f
+    def label(a,b):
+        if a < 1 or b < 1:
+            return -1
+        if a > len(T) or b > len(T[a-1]):
+            return k+1
+        return T[a-1][b-1]
+    if v == (i+1,j):
+        o = (i,j+1) if label(i-1,j+1) < k else (i-1,j)
+    elif v == (i,j+1):
+        o = (i+1,j) if label(i+1,j-1) < k else (i,j-1)
+    elif v == (i-1,j):
+        o = (i,j-1) if label(i+1,j-1) > k else (i+1,j)
+    else:
+        o = (i-1,j) if label(i-1,j+1) > k else (i,j+1)
+    return [f, o]
+
+def cycles(T):
+    """
+    Return the non-core open cycles of a domino tableau T, each as a
+    dictionary sending its labels to their moved dominoes.
+
+    NOTE:
+    A cycle is a smallest set of labels such that the dominoes D(k) and the
+    moved dominoes D'(k) of its labels cover the same squares, up to a square
+    outside T when the cycle is open. A cycle through the core square is
+    ignored.
+
+    EXAMPLE:
+        sage: cycles(((0, 1, 1), (2, 2)))
+        sage: [{2: [(2, 1), (3, 1)]}]
+        sage: cycles(((0, 1, 1), (2,), (2,)))
+        sage: [{2: [(2, 1), (2, 2)]}]
+    """
+    D = dominoes(T)
+    moved = dict((k, moved_domino(T,k,D[k])) for k in D)
+    owner = {}
+    for k in D:
+        for c in D[k]:
+            owner[c] = k
+    covers = defaultdict(list)
+    for k in moved:
+        for c in moved[k]:
+            covers[c].append(k)
+    result = []
+    seen = set()
+    for k in sorted(D):
+        if k in seen:
+            continue
+        cycle = set([k])
+        stack = [k]
+        core = False
+        while stack:
+            l = stack.pop()
+            neighbours = covers[D[l][0]] + covers[D[l][1]]
+            for c in moved[l]:
+                if c == (1,1):
+                    core = True
+                elif c in owner:
+                    neighbours.append(owner[c])
+            for m in neighbours:
+                if m not in cycle:
+                    cycle.add(m)
+                    stack.append(m)
+        seen |= cycle
+        before = set(c for l in cycle for c in D[l])
+        after = set(c for l in cycle for c in moved[l])
+        if not core and before != after:
+            result.append(dict((l, moved[l]) for l in cycle))
+    return result
+
+def move_through(T,cycle):
+    """
+    Return the tableau obtained from T by moving through a cycle.
+
+    EXAMPLE:
+        sage: move_through(((0, 1, 1), (2, 2)), cycles(((0, 1, 1), (2, 2)))[0])
+        sage: ((0, 1, 1), (2,), (2,))
+    """
+    new = {}
+    for i in range(len(T)):
+        for j in range(len(T[i])):
+            if T[i][j] not in cycle:
+                new[(i+1,j+1)] = T[i][j]
+    for l in cycle:
+        for c in cycle[l]:
+            new[c] = l
+    rows = max(c[0] for c in new)
+    return tuple(tuple(new[(i,j)] for j in range(1,1+sum(1 for c in new if c[0] == i)))
+                 for i in range(1,rows+1))
+
+
+""" cells """
+
+def find(parent,x):
+    """
+    Return the representative of x in a union-find forest, adding x to it if
+    it is new.
+    """
+    parent.setdefault(x,x)
+    while parent[x] != x:
+        parent[x] = parent[parent[x]]
+        x = parent[x]
+    return x
+
+def classify_b(n,permutations=None):
+    """
+    Sort the elements of B_n into left and 2-sided cells.
+
+    INPUT:
+    -- 'permutations': an iterable of signed permutations in one-line
+    notation to classify instead of all of B_n; it is only read once
+
+    OUTPUT:
+    -- a pair of dictionaries sending a representative tableau of each left
+    cell, and of each 2-sided cell, to the list of the words of its elements
+
+    EXAMPLE:
+        sage: sorted_cells(classify_b(2)[0])
+        sage: [[], [1, 21, 121], [2, 12, 212], [1212]]
+    """
+    if permutations is None:
+        permutations = (tuple(s*x for s, x in zip(signs,p))
+                        for p in itertools.permutations(range(1,n+1))
+                        for signs in itertools.product((1,-1),repeat=n))
+    parent = {}
+    moved = set()
+    elements = []
+    for p in permutations:
+        P, Q = domino_tableaux(p)
+        for T in (P, Q):
+            if T not in moved:
+                moved.add(T)
+                for cycle in cycles(T):
+                    parent[find(parent,T)] = find(parent,move_through(T,cycle))
+        elements.append((signed_permutation_to_word(p), P, Q))
+    left = defaultdict(list)
+    two_sided = {}
+    for w, P, Q in elements:
+        two_sided[find(two_sided,find(parent,P))] = find(two_sided,find(parent,Q))
+    sides = defaultdict(list)
+    for w, P, Q in elements:
+        left[find(parent,Q)].append(w)
+        sides[find(two_sided,find(parent,Q))].append(w)
+    return left, sides
+
+def kl_cells_text_b(n):
+    """
+    Return the text of KL_cells/B<n>: the Coxeter matrix of B_n, the left
+    cells and the 2-sided cells, as written by the W-graph computation.
+
+    EXAMPLE:
+        sage: kl_cells_text_b(3) == open('KL_cells/B3').read()
+        sage: True
+    """
+    left, two_sided = classify_b(n)
+    def m(s,t):
+        if s == t:
+            return 1
+        if abs(s-t) > 1:
+            return 2
+        return 4 if max(s,t) == n else 3
+    matrix = ["[" + " ".join(str(m(s,t)) for t in range(1,n+1)) + "]"
+              for s in range(1,n+1)]
+    lines = (["Coxeter Matrix:", ""] + matrix + ["", "", "Left cells:", ""] +
+             format_cells(sorted_cells(left)) + ["", "", "2-sided cells:", ""] +
+             format_cells(sorted_cells(two_sided)) + [""])
+    return "\n".join(lines) + "\n"
+
+def write_kl_cells_b(n,filename=None):
+    """
+    Write kl_cells_text_b(n) to filename, by default KL_cells/B<n>.
+    """
+    if filename is None:
+        filename = 'KL_cells/B' + str(n)
+    with open(filename,'w') as f:
+        f.write(kl_cells_text_b(n))
@@ -1,39 +1,14 @@
 import itertools
+import random
+from bisect import bisect_right
+from array import array
+import pickle
+import json
+import os
+from multiprocessing import Pool, cpu_count
 from collections import defaultdict
 from collections import OrderedDict
-
-""" conversions between strings, lists and tuples """
-
-def word_to_list(w):
-    """ Return the digits in a word (number) w as a list of integers.
-
-    EXAMPLES:
-        sage: word_to_list(231)
-        sage: [2,3,1]
-    """
-    return  [int(i) for i in str(w)]
-
-def word_to_tuple(w):
-    """ Like word_to_list, but to tuples.
-
-    EXAMPLES:
-        sage: word_to_tuple(231)_
-        sage: (2,3,1)
-    """
-    return tuple(int(i) for i in str(w))
-
-def list_or_tuple_to_word(l):
-    """ Concatenate the digits in a list or tuple to form a word. 
-
-    EXAMPLES:
-        sage: list_or_tuple_to_word([2,3,1])
-        sage: 231
-
-        sage: list_or_tuple_to_word((2,3,1)) 
-        sage: 231
-    """
-    return int(''.join(map(str,l)))
-
+from conversions import Word, word_to_list, word_to_tuple, list_or_tuple_to_word
 
 """ number of fully-commutative but not subregular elements """
 
@@ -87,10 +62,9 @@ def heap(w):
         sage: heap(132)
         sage: Finite poset containing 3 elements 
     """
-    w = word_to_list(w)
-    l = len(w)
-    f = lambda i,j: i < j and (w[i] == w[j] + 1 or w[i] == w[j] - 1)
-    return Poset((range(l),f))
+    t = word_to_tuple(w)
+    nbrs = [()] + [(s-1,s+1) for s in range(1,max(t)+1)] + [()]
+    return Poset((range(len(t)),heap_relations(t,nbrs)))
 
 def a(w):
     r"""
@@ -103,8 +77,10 @@ def a(w):
         sage: a(135)
         sage: 3
     """
-    l = heap(w).antichains()
-    return max([len(x) for x in l])
+    t = word_to_tuple(w)
+    nbrs = [()] + [(s-1,s+1) for s in range(1,max(t)+1)] + [()]
+    cols, down, level = heap_columns(t,nbrs)
+    return heap_width(range(len(t)),down)
 
 
 """ canonical word from heap """
@@ -147,15 +123,928 @@ def canonical_word(w):
         sage: canonical_word(132143)
         sage: 132413
     """
-    l = []
-    d = leveled_heap(w)
-    for i in d:
-        l = l + sorted(d[i])
-    return list_or_tuple_to_word(l)
+    return element_word(element_id(w))
+
+
+""" interned canonical forms """
+
+# Every canonical word met so far gets a small integer id, and the canonical
+# Word objects are shared, so that equal elements are equal as objects. Raw
+# words are normalized through a bounded cache, most recently used last.
+
+canonical_ids = {}
+canonical_words = []
+normal_form_cache = OrderedDict()
+NORMAL_FORM_CACHE_SIZE = 1 << 16
+
+def heap_canonical_tuple(w):
+    """
+    Return the letters of canonical_word(w), for a tuple w.
+
+    The level of each letter is one more than the highest level among the
+    earlier letters next to it in the Coxeter graph, so the levels are found
+    in one pass by keeping the top level of every column of the heap.
 
+    EXAMPLE:
+        sage: heap_canonical_tuple((1,3,2,1,4,3))
+        sage: (1,3,2,4,1,3)
+    """
+    top = defaultdict(int)
+    level = []
+    for s in w:
+        h = max(top[s-1],top[s+1]) + 1
+        level.append(h)
+        if h > top[s]:
+            top[s] = h
+    return tuple(w[i] for i in sorted(range(len(w)),
+                                      key=lambda i: (level[i],w[i])))
 
+def element_id(w):
+    """
+    Return the id of the element with reduced word w, interning its canonical
+    word if it is new.
 
+    EXAMPLE:
+        sage: element_id(1231) == element_id(2123)
+        sage: False
 
+        sage: element_id(1231) == element_id(1213)
+        sage: True
+    """
+    key = Word(w)
+    if key in normal_form_cache:
+        i = normal_form_cache.pop(key)
+    else:
+        c = Word(heap_canonical_tuple(key.letters()))
+        i = canonical_ids.get(c)
+        if i is None:
+            i = len(canonical_words)
+            canonical_ids[c] = i
+            canonical_words.append(c)
+        if len(normal_form_cache) >= NORMAL_FORM_CACHE_SIZE:
+            normal_form_cache.popitem(last=False)
+    normal_form_cache[key] = i
+    return i
+
+def element_word(i):
+    """
+    Return the canonical word of the element with id i.
+
+    EXAMPLE:
+        sage: element_word(element_id(132143))
+        sage: 132413
+    """
+    return canonical_words[i]
+
+
+""" enumeration of fully-commutative elements, for any Coxeter matrix """
+
+def coxeter_matrix_H(n):
+    """
+    Return the Coxeter matrix of H_n, with the strong bond between 1 and 2 as
+    in the rest of this file.
+
+    EXAMPLE:
+        sage: coxeter_matrix_H(3)
+        sage: [[1,5,2],[5,1,3],[2,3,1]]
+    """
+    M = [[2]*n for i in range(n)]
+    for i in range(n):
+        M[i][i] = 1
+        if i > 0:
+            M[i][i-1] = M[i-1][i] = 3
+    if n > 1:
+        M[0][1] = M[1][0] = 5
+    return M
+
+def coxeter_matrix_A(n):
+    """
+    Return the Coxeter matrix of A_n.
+
+    EXAMPLE:
+        sage: coxeter_matrix_A(3)
+        sage: [[1,3,2],[3,1,3],[2,3,1]]
+    """
+    M = coxeter_matrix_H(n)
+    if n > 1:
+        M[0][1] = M[1][0] = 3
+    return M
+
+def coxeter_neighbors(M):
+    """
+    Return a list whose s-th entry is the tuple of generators t != s that do
+    not commute with s. Generators are labeled 1, ..., n and an entry 0 in M
+    stands for m(s,t) = infinity, as in asymptotic_hecke.py.
+
+    EXAMPLE:
+        sage: coxeter_neighbors(coxeter_matrix_H(3))
+        sage: [(), (2,), (1,3), (2,)]
+    """
+    n = len(M)
+    return [()] + [tuple(t for t in range(1,n+1) if t != s and M[s-1][t-1] != 2)
+                   for s in range(1,n+1)]
+
+def heap_columns(t,nbrs):
+    """
+    Build the heap of the word t column by column.
+
+    INPUT:
+    -- 't': a tuple of generators
+    -- 'nbrs': the output of coxeter_neighbors(M)
+
+    OUTPUT:
+    -- a triple (cols, down, level): cols[s] lists the positions of s in t from
+    bottom to top, down[i] is a bitmask of the positions below or equal to
+    position i in the heap, and level[i] is the level of position i as in
+    leveled_heap.
+
+    EXAMPLE:
+        sage: heap_columns((1,3,2), coxeter_neighbors(coxeter_matrix_H(3)))
+        sage: ([[], [0], [2], [1]], [1, 2, 7], [1, 1, 2])
+    """
+    cols = [[] for i in nbrs]
+    down = []
+    level = []
+    for i in range(len(t)):
+        s = t[i]
+        d = 1 << i
+        h = 0
+        for u in (s,) + nbrs[s]:
+            if cols[u]:
+                j = cols[u][-1]
+                d |= down[j]
+                h = max(h, level[j])
+        cols[s].append(i)
+        down.append(d)
+        level.append(h+1)
+    return cols, down, level
+
+def heap_width(elements,down):
+    """
+    Return the largest size of an antichain among the given positions of a
+    heap with down-sets as in heap_columns.
+
+    NOTE:
+    By Dilworth's theorem this is the number of elements minus the size of a
+    largest matching between elements x < y of the heap.
+
+    EXAMPLE:
+        sage: cols, down, level = heap_columns((1,3,2,4), coxeter_neighbors(coxeter_matrix_H(4)))
+        sage: heap_width(range(4),down)
+        sage: 2
+    """
+    elements = list(elements)
+    match = {}
+    def augment(i,seen):
+        for j in elements:
+            if j != i and down[j] >> i & 1 and j not in seen:
+                seen.add(j)
+                if j not in match or augment(match[j],seen):
+                    match[j] = i
+                    return True
+        return False
+    return len(elements) - sum(1 for i in elements if augment(i,set()))
+
+def _extends_fc(s,M,nbrs,cols,down):
+    """
+    Decide whether putting s on top of a fully-commutative heap, given by the
+    columns and down-sets of heap_columns, gives a fully-commutative heap.
+
+    NOTE:
+    By Stembridge's criterion, this fails exactly when the new element covers
+    another copy of s (ws < w) or ends a convex chain s,t,s,... of length
+    m(s,t). Both can be read off the tops of the columns of s and its
+    neighbors.
+    """
+    cs = cols[s]
+    top_s = cs[-1] if cs else -1
+    x = len(down)
+    d = 1 << x
+    for t in nbrs[s]:
+        if cols[t]:
+            d |= down[cols[t][-1]]
+    if top_s > -1:
+        if all(not cols[t] or cols[t][-1] < top_s for t in nbrs[s]):
+            return False
+        d |= down[top_s]
+    for t in nbrs[s]:
+        m = M[s-1][t-1]
+        if m == 0:
+            continue
+        ct = cols[t]
+        if len(ct) < m // 2 or len(cs) < (m-1) // 2:
+            continue
+        # the last m-1 elements of columns s and t must be t,s,t,... from the
+        # top down, with nothing else of those columns in between
+        chain = []
+        i, j = len(ct)-1, len(cs)-1
+        while len(chain) < m-1:
+            if len(chain) % 2 == 0:
+                chain.append(ct[i])
+                i -= 1
+            else:
+                chain.append(cs[j])
+                j -= 1
+        bound = [x] + chain
+        if any(bound[k] < bound[k+1] for k in range(m-1)):
+            continue
+        if i > -1 and ct[i] > chain[-1]:
+            continue
+        if j > -1 and cs[j] > chain[-1]:
+            continue
+        a = chain[-1]
+        # the chain is convex iff the interval [a,x] has exactly m elements
+        size = 1
+        for z in range(a, x):
+            if d >> z & 1 and down[z] >> a & 1:
+                size += 1
+        if size == m:
+            return False
+    return True
+
+""" heaps of arbitrary words, for any Coxeter matrix """
+
+def heap_relations(t,nbrs):
+    """
+    Return pairs (i,j) of positions of the word t generating the order of its
+    heap: each position j is above the top of its own column and of the
+    columns of its neighbors, at the time it is reached.
+
+    INPUT:
+    -- 't': a tuple of generators
+    -- 'nbrs': the output of coxeter_neighbors(M)
+
+    EXAMPLE:
+        sage: heap_relations((1,3,2,1), coxeter_neighbors(coxeter_matrix_H(3)))
+        sage: [(0, 2), (1, 2), (0, 3), (2, 3)]
+    """
+    tops = [-1]*len(nbrs)
+    relations = []
+    for j in range(len(t)):
+        s = t[j]
+        for u in (s,) + nbrs[s]:
+            if tops[u] > -1:
+                relations.append((tops[u],j))
+        tops[s] = j
+    return relations
+
+def _push_letter(s,nbrs,cols,down):
+    """
+    Put s on top of the heap given by the columns and down-sets of
+    heap_columns, in place.
+    """
+    d = 1 << len(down)
+    for u in (s,) + nbrs[s]:
+        if cols[u]:
+            d |= down[cols[u][-1]]
+    cols[s].append(len(down))
+    down.append(d)
+
+def fc_prefix(w,M,nbrs=None):
+    """
+    Return the length of the longest prefix of the word w that is a reduced
+    word of a fully-commutative element of the Coxeter group with Coxeter
+    matrix M.
+
+    NOTE:
+    By Stembridge's criterion, a word is a reduced word of a
+    fully-commutative element exactly when no element of its heap covers
+    another copy of the same generator and no chain s,t,s,... of length
+    m(s,t) is convex. A prefix is an order ideal of the heap, so the criterion
+    is checked by _extends_fc one letter at a time, as the heap is built.
+
+    EXAMPLE:
+        sage: fc_prefix(12121,coxeter_matrix_H(2))
+        sage: 4
+
+        sage: fc_prefix(1323,coxeter_matrix_H(3))
+        sage: 3
+    """
+    t = Word(w).letters()
+    if nbrs is None:
+        nbrs = coxeter_neighbors(M)
+    cols = [[] for u in nbrs]
+    down = []
+    for s in t:
+        if not _extends_fc(s,M,nbrs,cols,down):
+            break
+        _push_letter(s,nbrs,cols,down)
+    return len(down)
+
+def is_fc_word(w,M):
+    """
+    Decide whether the word w is a reduced word of a fully-commutative element
+    of the Coxeter group with Coxeter matrix M.
+
+    EXAMPLE:
+        sage: is_fc_word((1,2,1,2),coxeter_matrix_H(2))
+        sage: True
+
+        sage: is_fc_word((1,2,1),coxeter_matrix_A(2))
+        sage: False
+    """
+    return fc_prefix(w,M) == len(Word(w))
+
+def commutation_class(w,M):
+    """
+    Return the word read from the heap of w level by level, and from left to
+    right in each level, as in canonical_word. Two words are related by
+    commutations exactly when they give the same word.
+
+    EXAMPLE:
+        sage: commutation_class((3,1,2,4,3),coxeter_matrix_A(4)) == commutation_class((1,3,2,4,3),coxeter_matrix_A(4))
+        sage: True
+    """
+    t = Word(w).letters()
+    cols, down, level = heap_columns(t,coxeter_neighbors(M))
+    return Word(t[i] for i in sorted(range(len(t)),
+                                     key=lambda i: (level[i],t[i])))
+
+def fc_mask(words,M):
+    """
+    Return the list of is_fc_word(w,M) for the words w in words.
+
+    NOTE:
+    The words are visited in lexicographic order and the heap of the current
+    word is kept, so a word only pays for the letters after its common prefix
+    with the previous one: the heap is cut back to that prefix by popping
+    columns, and a word starting with a rejected prefix is rejected at once.
+
+    EXAMPLE:
+        sage: fc_mask([(1,2,1),(1,2,1,2,1),(2,1,2,1),(1,1)],coxeter_matrix_H(2))
+        sage: [True, False, True, False]
+    """
+    nbrs = coxeter_neighbors(M)
+    words = [Word(w).letters() for w in words]
+    mask = [False]*len(words)
+    cols = [[] for u in nbrs]
+    down = []
+    current = ()
+    for i in sorted(range(len(words)),key=lambda i: words[i]):
+        t = words[i]
+        p = 0
+        while p < len(down) and p < len(t) and t[p] == current[p]:
+            p += 1
+        if p == len(down) < len(current) and p < len(t) and t[p] == current[p]:
+            current = t      # the same rejected letter comes next
+            continue
+        while len(down) > p:
+            cols[current[len(down)-1]].pop()
+            down.pop()
+        current = t
+        while len(down) < len(t) and _extends_fc(t[len(down)],M,nbrs,cols,down):
+            _push_letter(t[len(down)],nbrs,cols,down)
+        mask[i] = len(down) == len(t)
+    return mask
+
+def fc_filter(words,M):
+    """
+    Return the words in words that are reduced words of fully-commutative
+    elements of the Coxeter group with Coxeter matrix M, in the same order.
+    """
+    return [w for (w,ok) in zip(words,fc_mask(words,M)) if ok]
+
+
+def fc_elements(M, max_length=None, max_width=None):
+    """
+    Generate the fully-commutative elements of the Coxeter group with Coxeter
+    matrix M, in canonical heap form (read by levels as in canonical_word),
+    depth-first.
+
+    INPUT:
+    -- 'M': a Coxeter matrix with generators labeled 1, ..., n; an entry 0
+    stands for m(s,t) = infinity
+    -- 'max_length': stop after this length (needed for infinite FC sets)
+    -- 'max_width': only generate the heaps whose antichains have at most this
+    many elements; for the groups of type H, this bounds the a-value
+
+    OUTPUT:
+    -- a generator of tuples, starting with the identity ()
+
+    NOTE:
+    Every heap of length l+1 is obtained from exactly one heap of length l by
+    putting a new maximal element on top, namely the one whose label is the
+    largest among the maximal elements. So the heaps form a tree, which is
+    searched depth-first: a single heap is built up and taken down one
+    letter at a time, as in fc_prefix, and only the letters still to be tried
+    at each level are kept, so the memory grows with the length of the
+    longest element and not with the number of elements. The width of a heap
+    never drops when an element is added, so the heaps that are too wide are
+    pruned with all their descendants.
+
+    EXAMPLE:
+        sage: list(fc_elements(coxeter_matrix_H(2)))
+        sage: [(), (1,), (1,2), (1,2,1), (1,2,1,2), (2,), (2,1), (2,1,2),
+               (2,1,2,1)]
+
+        sage: sum(1 for w in fc_elements(coxeter_matrix_H(5))) == fc_cardinality(5)
+        sage: True
+    """
+    n = len(M)
+    nbrs = coxeter_neighbors(M)
+    cols = [[] for u in nbrs]
+    down = []
+    level = []
+    t = []
+
+    def children():
+        # the letters s, from the largest down, such that the heap with s on
+        # top is a child of the current one; they are tried from the end
+        if max_length is not None and len(t) >= max_length:
+            return []
+        tops = [c[-1] if c else -1 for c in cols]
+        maximal = [u for u in range(1,n+1) if tops[u] > -1 and
+                   all(tops[u] > tops[v] for v in nbrs[u])]
+        letters = []
+        for s in range(n,0,-1):
+            if any(u > s and u not in nbrs[s] for u in maximal):
+                continue
+            if not _extends_fc(s,M,nbrs,cols,down):
+                continue
+            if max_width is not None:
+                d = 0
+                for u in (s,) + nbrs[s]:
+                    if cols[u]:
+                        d |= down[cols[u][-1]]
+                rest = [i for i in range(len(t)) if not d >> i & 1]
+                if heap_width(rest,down) >= max_width:
+                    continue
+            letters.append(s)
+        return letters
+
+    yield ()
+    stack = [children()]
+    while stack:
+        if not stack[-1]:
+            stack.pop()
+            if t:
+                s = t.pop()
+                cols[s].pop()
+                down.pop()
+                level.pop()
+            continue
+        s = stack[-1].pop()
+        level.append(max([level[cols[u][-1]] for u in (s,) + nbrs[s]
+                          if cols[u]] + [0]) + 1)
+        _push_letter(s,nbrs,cols,down)
+        t.append(s)
+        yield tuple(t[i] for i in sorted(range(len(t)),
+                                          key=lambda i: (level[i],t[i])))
+        stack.append(children())
+
+
+""" the 2-sided cell of a-value 2 in H_n, without multiplication """
+
+def right_stub(w):
+    """
+    Return the right stub of a f.c. element w of a-value 2 in type H, i.e.,
+    the smallest top part (upper set) of the heap of w that still contains two
+    incomparable elements, as a canonical word.
+
+    NOTE:
+    Every upper set containing two incomparable elements x, y contains the
+    upper set generated by x and y, so the stub is the smallest of these.
+    Two elements of the 2-sided cell of a-value 2 lie in the same left cell
+    if and only if they have the same right stub, as checked against the
+    multiplication graphs for n <= 7.
+
+    EXAMPLE:
+        sage: right_stub(321213)
+        sage: 13
+
+        sage: right_stub(2132413)
+        sage: 13
+    """
+    t = word_to_tuple(w)
+    cols, down, level = heap_columns(t,coxeter_neighbors(coxeter_matrix_H(max(t))))
+    l = len(t)
+    up = [sum(1 << j for j in range(i,l) if down[j] >> i & 1) for i in range(l)]
+    best = None
+    for i in range(l):
+        for j in range(i+1,l):
+            if not up[i] >> j & 1:
+                u = up[i] | up[j]
+                if best is None or bin(u).count('1') < bin(best).count('1'):
+                    best = u
+    return canonical_word(tuple(t[i] for i in range(l) if best >> i & 1))
+
+def a2_cell_direct(n):
+    """
+    Return the 2-sided cell of a-value 2 in H_n with its left cells, their
+    intersections with their inverses and the distinguished involutions,
+    without computing any product.
+
+    OUTPUT:
+    -- a quadruple (C, lcells, intersections, involutions), where C is sorted
+    and the other three lists are as in cell_partition(C,n)
+
+    NOTE:
+    The cell consists of the f.c. elements whose heaps have width 2, which
+    fc_elements lists directly by pruning wider heaps. The left cells are the
+    classes of elements with the same right stub, and the distinguished
+    involution of a left cell is its shortest involution. The work is
+    proportional to the size of the cell, up to a polynomial in the length.
+    This agrees with cell(13,n) and cell_partition for n <= 7.
+
+    EXAMPLE:
+        sage: C, lcells, intersections, involutions = a2_cell_direct(3)
+        sage: involutions
+        sage: [13, 2132, 121321, 21213212, 3212132123]
+    """
+    M = coxeter_matrix_H(n)
+    nbrs = coxeter_neighbors(M)
+    C = sorted(canonical_word(t) for t in fc_elements(M,max_width=2)
+               if heap_width(range(len(t)),heap_columns(t,nbrs)[1]) == 2)
+    classes = OrderedDict()
+    for w in C:
+        classes.setdefault(right_stub(w),[]).append(w)
+    lcells = list(classes.values())
+    cell_of = {}
+    for k in range(len(lcells)):
+        for w in lcells[k]:
+            cell_of[w] = k
+    intersections = []
+    involutions = []
+    for k in range(len(lcells)):
+        intersections.append([w for w in lcells[k]
+                              if cell_of[canonical_word(inverse(w))] == k])
+        involutions.append(min(w for w in intersections[k]
+                               if canonical_word(inverse(w)) == w))
+    return C, lcells, intersections, involutions
+
+
+""" counting fully-commutative elements by length and a-value, for types A, B, H """
+
+# A fully-commutative heap on the path 1 - 2 - ... - n in which every bond
+# other than the one between 1 and 2 is simple is determined column by column:
+# if column i has k elements, at most one element of column i+1 sits in each
+# of the k+1 slots below, between and above them. A column state is the
+# number k together with the ranges of gaps of column i that still have to be
+# filled from column i+1 (to keep the word reduced and to break convex braid
+# chains). For the a-value we also carry the antichains of the heap built so
+# far, each remembered by its size and the interval of column i it is
+# incomparable with.
+
+def _path_bonds(n,cartan):
+    """
+    Return the bonds m(i,i+1) of the Coxeter graph of the given type.
+
+    EXAMPLE:
+        sage: _path_bonds(4,'H')
+        sage: [5, 3, 3]
+    """
+    return [{'A': 3, 'B': 4, 'H': 5}[cartan]] + [3]*(n-2) if n > 1 else []
+
+def _column_moves(i,n,k,req,m):
+    """
+    Yield the pairs (c, req') describing the ways to put column i+1 on top of
+    column i, where c[j] is the number of elements of column i+1 in slot j of
+    column i and req' is the set of gap ranges of column i+1 that column i+2
+    has to fill.
+    """
+    if i == n:
+        if not req:
+            yield (0,)*(k+1), frozenset()
+        return
+    single = set(lo for (lo,hi) in req if lo == hi)
+    opts = [(0,1)] + [(1,) if g in single else (0,1)
+                      for g in range(1,k)] + [(0,1)]*(k > 0)
+    for c in itertools.product(*opts):
+        if any(not any(c[lo:hi+1]) for (lo,hi) in req):
+            continue
+        seq = []
+        b = 0
+        for j in range(k+1):
+            if j > 0:
+                seq.append((0,j))
+            if c[j]:
+                b += 1
+                seq.append((1,b))
+        new = set()
+        ok = True
+        for start in range(len(seq)-m+1):
+            window = seq[start:start+m]
+            if any(window[t][0] == window[t+1][0] for t in range(m-1)):
+                continue
+            lower = [p for (x,p) in window if x == 0]
+            upper = [p for (x,p) in window if x == 1]
+            if len(lower) > 1 and i > 1:    # broken by column i-1
+                continue
+            if len(upper) < 2:
+                ok = False
+                break
+            new.add((upper[0],upper[-1]-1))
+        if not ok:
+            continue
+        minimal = []
+        for (lo,hi) in sorted(new,key=lambda r: (-r[0],r[1])):
+            if not minimal or hi < minimal[-1][1]:
+                minimal.append((lo,hi))
+        yield c, frozenset(minimal)
+
+def _antichain_moves(front,k,c,remaining):
+    """
+    Move the antichains of the heap through column i: extend them by an
+    element of column i if possible and recompute the incomparable intervals
+    in column i+1. Return the new antichains and the largest size reached.
+    """
+    kk = sum(c)
+    below = [0]
+    for j in range(k+1):
+        below.append(below[-1] + c[j])
+    best = 0
+    new = []
+    for (s,lo,hi) in front:
+        for p in range(lo+1,min(hi,k+1)):
+            best = max(best,s+1)
+            new.append((s+1,below[p],below[p]+1))
+        new.append((s,below[lo],kk+1 if hi > k else below[hi]+1))
+    new.append((0,0,kk+1))
+    pruned = []
+    for e in sorted(set(new),key=lambda e: (-e[0],e[1],-e[2])):
+        if e[0] + remaining <= best and e[0] > 0:
+            continue
+        if not any(f[0] >= e[0] and f[1] <= e[1] and f[2] >= e[2] for f in pruned):
+            pruned.append(e)
+    return tuple(sorted(pruned)), best
+
+def _column_states(n,cartan):
+    """
+    Return the pair (layers, moves): layers[i] is the set of states (k, req)
+    of column i that can be completed to a heap, and moves[(i,k,req)] lists
+    the triples (c, sum(c), req') of _column_moves for such a state.
+    """
+    bonds = _path_bonds(n,cartan) + [None]
+    layers = [None, set((k,frozenset((g,g) for g in range(1,k)))
+                        for k in range(n+2))]      # nothing is left of 1
+    cache = {}
+    moves = {}
+    for i in range(1,n+1):
+        layer = set()
+        for (k,req) in layers[i]:
+            key = (k,req,bonds[i-1],i == 1,i == n)
+            if key not in cache:
+                cache[key] = [(c,sum(c),req2) for (c,req2) in
+                              _column_moves(i,n,k,req,bonds[i-1])]
+            moves[(i,k,req)] = cache[key]
+            layer.update((kk,req2) for (c,kk,req2) in cache[key])
+        layers.append(layer)
+    alive = set([(0,frozenset())])
+    for i in range(n,0,-1):
+        alive = set((k,req) for (k,req) in layers[i] if any(
+            (kk,req2) in alive for (c,kk,req2) in moves[(i,k,req)]))
+        layers[i] = alive
+    return layers, moves
+
+def fc_length_a_table(n,cartan='H',by_a_value=True):
+    """
+    Return the number of fully-commutative elements of the Coxeter group of
+    type A_n, B_n or H_n by length and a-value (the width of the heap), using
+    a transfer matrix over heap columns.
+
+    OUTPUT:
+    -- a dictionary with keys (length, a-value) if by_a_value is True, and
+    keys lengths otherwise
+
+    NOTE:
+    Without the a-value the column states are small and n can be in the
+    hundreds. The a-value needs the antichains of the heap in the state, which
+    limits n to a few dozen.
+
+    EXAMPLE:
+        sage: fc_length_a_table(3)
+        sage: {(0,0): 1, (1,1): 3, (2,1): 4, (2,2): 1, (3,1): 4, (3,2): 2,
+               (4,1): 4, (4,2): 3, (5,1): 3, (5,2): 4, (6,2): 5, (7,2): 4,
+               (8,2): 3, (9,2): 2, (10,2): 1}
+
+        sage: sum(fc_length_a_table(30,'H',False).values()) == fc_cardinality(30)
+        sage: True
+    """
+    bits = 2*n + 4 + (-2*n) % 4     # every count is below 4^(n+1)
+    fresh = lambda k: ((0,0,k+1),) if by_a_value else ()
+    # first pass: the column states (k, req) that can be completed to a heap
+    layers, moves = _column_states(n,cartan)
+    # second pass: the packed length polynomials, for each state
+    # (k, req, antichains, best, done)
+    states = defaultdict(int)
+    for (k,req) in layers[1]:
+        states[(k,req,fresh(k),0,0)] += 1 << (bits*k)
+    antichains = {}
+    for i in range(1,n+1):
+        new = defaultdict(int)
+        for (k,req,front,best,done), poly in states.items():
+            for (c,kk,req2) in moves[(i,k,req)]:
+                if (kk,req2) not in layers[i+1] if i < n else req2:
+                    continue
+                if by_a_value:
+                    if (front,c) not in antichains:
+                        antichains[(front,c)] = _antichain_moves(front,k,c,
+                                                                 (n-i+1)//2)
+                    front2, b = antichains[(front,c)]
+                    b = max(b,best)
+                    if kk == 0:
+                        key = (0,req2,fresh(0),0,done+b)
+                    else:
+                        key = (kk,req2,front2,b,done)
+                else:
+                    key = (kk,req2,(),0,0)
+                new[key] += poly << (bits*kk)
+        states = new
+    table = defaultdict(int)
+    for (k,req,front,best,done), poly in states.items():
+        digits = '%x' % poly
+        digits = '0'*(-len(digits) % (bits//4)) + digits
+        l = len(digits) // (bits//4)
+        for j in range(0,len(digits),bits//4):
+            l -= 1
+            x = int(digits[j:j+bits//4],16)
+            if x:
+                table[(l,done+best) if by_a_value else l] += x
+    return dict(table)
+
+
+""" ranking fully-commutative elements of types A, B, H """
+
+# A fully-commutative element is a path through the column states of
+# fc_length_a_table: the size of column 1, then the slots of column i taken
+# by column i+1, for i = 1, ..., n-1. Counting the completions of every state
+# numbers the paths from 0 to N-1 in the order of the moves, so an element
+# is ranked or unranked in one pass over its columns.
+
+rank_tables = {}
+
+def build_rank_table(n,cartan='H'):
+    """
+    Compute, and keep in rank_tables, the table used by fc_rank and
+    fc_unrank.
+
+    OUTPUT:
+    -- a triple (first, steps, total): first is the triple (options, offsets, index)
+    for the states of column 1, and steps[i] sends each state of column i to
+    such a triple for its moves. options lists the pairs (choice, next state)
+    in order, offsets[j] is the number of elements whose path takes an
+    earlier option, and index sends a choice to its position in options.
+    total is the number of fully-commutative elements.
+    """
+    key = (n,cartan)
+    if key in rank_tables:
+        return rank_tables[key]
+    layers, moves = _column_states(n,cartan)
+    count = {(0,frozenset()): 1}
+    steps = [None]*(n+1)
+    for i in range(n,0,-1):
+        steps[i] = {}
+        new = {}
+        for (k,req) in layers[i]:
+            options = []
+            offsets = []
+            total = 0
+            for (c,kk,req2) in moves[(i,k,req)]:
+                if (kk,req2) in count:
+                    options.append((c,(kk,req2)))
+                    offsets.append(total)
+                    total += count[(kk,req2)]
+            steps[i][(k,req)] = (options,offsets,
+                                 dict((options[j][0],j)
+                                      for j in range(len(options))))
+            new[(k,req)] = total
+        count = new
+    options = [(k,(k,req)) for (k,req) in sorted(layers[1],
+                                                 key=lambda t: t[0])]
+    offsets = []
+    total = 0
+    for (k,state) in options:
+        offsets.append(total)
+        total += count[state]
+    first = (options,offsets,dict((options[j][0],j)
+                                  for j in range(len(options))))
+    rank_tables[key] = (first,steps,total)
+    return rank_tables[key]
+
+def fc_count(n,cartan='H'):
+    """
+    Return the number of fully-commutative elements of the Coxeter group of
+    type A_n, B_n or H_n, from the table of build_rank_table.
+
+    EXAMPLE:
+        sage: fc_count(3) == fc_cardinality(3)
+        sage: True
+    """
+    return build_rank_table(n,cartan)[2]
+
+def fc_rank(w,n,cartan='H'):
+    """
+    Return the rank of a fully-commutative element w of the Coxeter group of
+    type A_n, B_n or H_n, an integer from 0 to N-1 where N is the number of
+    fully-commutative elements.
+
+    NOTE:
+    The columns of the heap of w are read from any reduced word of w: two
+    letters next to each other in the Coxeter graph never commute, so their
+    order is the same in all reduced words. A ValueError is raised if w is
+    not a fully-commutative element.
+
+    EXAMPLE:
+        sage: [fc_rank(w,2) for w in [0, 1, 2, 12, 21, 121, 212, 1212, 2121]]
+        sage: [0, 2, 1, 3, 4, 6, 5, 7, 8]
+    """
+    t = word_to_tuple(w) if w else ()
+    first, steps, total = build_rank_table(n,cartan)
+    cols = [[] for i in range(n+2)]
+    for j in range(len(t)):
+        cols[t[j]].append(j)
+    options, offsets, index = first
+    if len(cols[1]) not in index:
+        raise ValueError("%s is not fully commutative" % (w,))
+    j = index[len(cols[1])]
+    r = offsets[j]
+    state = options[j][1]
+    for i in range(1,n+1):
+        p = cols[i]
+        c = [0]*(len(p)+1)
+        k = 0
+        for x in cols[i+1]:
+            while k < len(p) and p[k] < x:
+                k += 1
+            c[k] += 1
+        options, offsets, index = steps[i][state]
+        j = index.get(tuple(c))
+        if j is None:
+            raise ValueError("%s is not fully commutative" % (w,))
+        r += offsets[j]
+        state = options[j][1]
+    return r
+
+def fc_unrank(r,n,cartan='H'):
+    """
+    Return the fully-commutative element of rank r, as in fc_rank, as its
+    canonical word.
+
+    EXAMPLE:
+        sage: [fc_unrank(r,2) for r in range(1,9)]
+        sage: [2, 1, 12, 21, 212, 121, 1212, 2121]
+    """
+    first, steps, total = build_rank_table(n,cartan)
+    if not 0 <= r < total:
+        raise ValueError("rank %s out of range" % r)
+    options, offsets, index = first
+    j = bisect_right(offsets,r) - 1
+    r -= offsets[j]
+    sizes = [options[j][0]]
+    slots = []
+    state = options[j][1]
+    for i in range(1,n):
+        options, offsets, index = steps[i][state]
+        j = bisect_right(offsets,r) - 1
+        r -= offsets[j]
+        c, state = options[j]
+        slots.append(c)
+        sizes.append(state[0])
+    return Word(heap_canonical_tuple(_heap_from_columns(sizes,slots)))
+
+def _heap_from_columns(sizes,slots):
+    """
+    Return a word of the heap with sizes[i] elements in column i+1, where
+    slots[i][j] elements of column i+2 sit in slot j of column i+1.
+    """
+    label = []
+    first = []
+    for i in range(len(sizes)):
+        first.append(len(label))
+        label.extend([i+1]*sizes[i])
+    succ = [[] for x in label]
+    for i in range(len(sizes)):
+        for j in range(1,sizes[i]):
+            succ[first[i]+j-1].append(first[i]+j)
+    for i in range(len(slots)):
+        merged = []
+        b = 0
+        for j in range(sizes[i]+1):
+            if j > 0:
+                merged.append(first[i]+j-1)
+            if slots[i][j]:
+                merged.append(first[i+1]+b)
+                b += 1
+        for j in range(1,len(merged)):
+            succ[merged[j-1]].append(merged[j])
+    indegree = [0]*len(label)
+    for x in range(len(label)):
+        for y in succ[x]:
+            indegree[y] += 1
+    order = [x for x in range(len(label)) if indegree[x] == 0]
+    for x in order:
+        for y in succ[x]:
+            indegree[y] -= 1
+            if indegree[y] == 0:
+                order.append(y)
+    return tuple(label[x] for x in order)
+
+def random_fc_element(n,cartan='H'):
+    """
+    Return a fully-commutative element of the Coxeter group of type A_n, B_n
+    or H_n, chosen uniformly at random, as its canonical word.
+    """
+    return fc_unrank(random.randrange(fc_count(n,cartan)),n,cartan)
 
 
 """ Tuple Operations """
@@ -357,13 +1246,28 @@ def left_justify(y):
 
 
     l = []
-    remain = y
-    while remain != tuple():
-        x = onetwo_on_left(remain)[0]
-        y = onetwo_on_left(remain)[1]
-        ll = my_append(l,x)
-        l = my_append(ll,before_12(y))
-        remain = after_12(y) 
+    remain = list(y)
+    while remain:
+        # the 12-coset decomposition of remain, as in onetwo_on_left
+        parabolic = []
+        i = first_12(remain)
+        if i > -1:
+            s = remain[i]
+            while len(parabolic) < 4 and s in remain:
+                j = remain.index(s)
+                if any(t == s-1 or t == s+1 for t in remain[:j]):
+                    break
+                parabolic.append(s)
+                del remain[j]
+                s = 3 - s
+        if parabolic:
+            l.append(tuple(parabolic))
+        i = first_12(remain)
+        if i == -1:
+            i = len(remain)
+        if i > 0:
+            l.append(tuple(remain[:i]))
+        del remain[:i]
     return l
 
 def right_justify(y):
@@ -375,10 +1279,7 @@ def right_justify(y):
         sage: [(1,2),(3,4,5),(1,2,1)]
     
     """
-    z = y[::-1]
-    l = left_justify(z)
-    ll = [i[::-1] for i in l]
-    return ll[::-1]
+    return [seg[::-1] for seg in reversed(left_justify(y[::-1]))]
 
 
 """ Green's f-basis from right-justified word """
@@ -410,32 +1311,54 @@ def ffactors(y):
         sage: [3,A,3,4,5,1,2]
 
     """
-    l = right_justify(y)
+    return list(justification(y)[1])
+
+justifications = {}
+
+def justification(y):
+    """
+    Return the segments of the right-justified word of y and the factors of
+    Green's f-basis vector for y, found in one pass over the segments and
+    cached by the word y, so that they are read off y itself, as in
+    ffactors, and not off its canonical word. The vector itself, a
+    polynomial in the c_s with up to 2^k monomials for k factors, is only
+    built on demand, by factor_to_poly.
+
+    EXAMPLE:
+        sage: justification((1,2,3,1,4,2,1,5))
+        sage: (((1,2),(3,4,5),(1,2,1)), (A,3,4,5,B))
+    """
+    key = Word(y)
+    if key in justifications:
+        return justifications[key]
+    l = right_justify(key.letters())
     factors = []
     for i in range(len(l)):
         seg = l[i]
         if seg[0] == 1 or seg[0] == 2:
             if seg == (1,) or seg == (2,) or seg == (2,1):
-                factors = factors + [i for i in seg]
+                new = list(seg)
             elif seg == (1,2):
                 if i < len(l) - 2 and l[i+2][0] == 1:
-                    factors = factors + [A]
+                    new = [A]
                 else:
-                    factors = factors + [1,2]
+                    new = [1,2]
             elif seg == (1,2,1):
-                factors = factors + [B]
+                new = [B]
             elif seg == (2,1,2):
                 if i < len(l) - 2 and l[i+2][0] == 1:
-                    factors = factors + [E]
+                    new = [E]
                 else:
-                    factors = factors + [C]
+                    new = [C]
             elif seg == (1,2,1,2):
-                factors = factors + [D]
+                new = [D]
             elif seg == (2,1,2,1):
-                factors = factors + [F]
+                new = [F]
         else:
-            factors = factors + [j for j in seg]
-    return factors
+            new = list(seg)
+        factors += new
+    justifications[key] = (tuple(l), tuple(factors))
+    return justifications[key]
 
 def factor_to_tuple(l):
     """
@@ -479,44 +1402,40 @@ def factor_to_poly(l):
         sage: factor_to_poly([A,4,B])
         sage: {(1,2,4,1):-1, (4,1,2,1):-1, (4,1):1, (1,2,4,1,2,1):1}
     """
-    d = defaultdict(int)
-    d[tuple()] = 1
+    d = {(): 1}
     for i in l:
-        if i == A:
-            for w in list(d):
-                d[w+(1,2)] += d[w]
-                d[w] = -d[w]
-        elif i == B:
-            for w in list(d):
-                d[w+(1,2,1)] += d[w]
-                d[w+(1,)] += -d[w]
-                del d[w]
-        elif i == C:
-            for w in list(d):
-                d[w+(2,1,2)] += d[w]
-                d[w+(2,)] += -d[w]
-                del d[w]
-        elif i == D:
-            for w in list(d):
-                d[w+(1,2,1,2)] += d[w]
-                d[w+(1,2)] += -2*d[w]
-                del d[w]
-        elif i == E:
-            for w in list(d):
-                d[w+(2,1,2)] += d[w]
-                d[w+(2,)] += -2*d[w]
-                del d[w]
-        elif i == F:
-            for w in list(d):
-                d[w+(2,1,2,1)] += d[w]
-                d[w+(2,1)] += -2*d[w]
-                del d[w]
-        else:
-            for w in list(d):
-                d[w+(i,)] += d[w]
-                del d[w]
+        d = times_factor(d,i)
     return d
 
+def times_factor(d,i):
+    """
+    Multiply a polynomial d in the c_s, given as a dictionary of monomials, on
+    the right by a factor i of an f-basis vector; return a new dictionary.
+
+    EXAMPLE:
+        sage: times_factor({(4,3):1},A)
+        sage: {(4,3):-1, (4,3,1,2):1}
+    """
+    if i == A:
+        tails = [((1,2),1), ((),-1)]
+    elif i == B:
+        tails = [((1,2,1),1), ((1,),-1)]
+    elif i == C:
+        tails = [((2,1,2),1), ((2,),-1)]
+    elif i == D:
+        tails = [((1,2,1,2),1), ((1,2),-2)]
+    elif i == E:
+        tails = [((2,1,2),1), ((2,),-2)]
+    elif i == F:
+        tails = [((2,1,2,1),1), ((2,1),-2)]
+    else:
+        tails = [((i,),1)]
+    dd = defaultdict(int)
+    for w in d:
+        for (t,c) in tails:
+            dd[w+t] += c * d[w]
+    return dd
+
 
 """ multiplication of c_s * c_w or c_w * c_s """
 
@@ -562,7 +1481,7 @@ def s_once(s,y):
     elif len(neighbors_before(s,y)) == 2: # so sy is f.c.
         d[(s,)+y] += 1
     elif s > 3 or (s == 3 and y[first_neighbor(3,y)] == 4):
-        factors = ffactors(y)
+        factors = justification(y)[1]
         neighbor = first_neighbor(s,factors)
         left = tuple(factors[:neighbor])
         d[factor_to_tuple(factors[neighbor+1:])] += 1 
@@ -627,6 +1546,9 @@ def s_times_w(s,w):
         sage: s_once(6,(4,1,2,1,7,3,6))
         sage: {146231: 1} 
     """
+    d = table_product(0,s,w)
+    if d is not None:
+        return d
     todo = defaultdict(int)
     todo[((s,),w)] = 1
     done = defaultdict(int)
@@ -660,7 +1582,7 @@ def clean_up(d):
     dd = defaultdict(int)
     for k in d:
         if d[k] != 0:
-            dd[canonical_word(list_or_tuple_to_word(k))] += d[k]
+            dd[canonical_word(k)] += d[k]
     return dd
 
 def inverse(w):
@@ -684,6 +1606,9 @@ def w_times_s(w,s):
         sage: w_times_s((2,1,4,5),1)
         sage: {2415: v+1/v}
     """
+    dd = table_product(1,s,w)
+    if dd is not None:
+        return dd
     y = w[::-1]
     d = s_times_w(s,y)
     dd = defaultdict(int)
@@ -692,6 +1617,74 @@ def w_times_s(w,s):
     return dd
 
 
+""" tables of c_s * c_w and c_w * c_s over the f.c. elements of H_n """
+
+# action_tables[n] = (rows, coefficients, left, right): rows maps the id of
+# each f.c. element of H_n to its row r, coefficients lists the distinct
+# coefficients, and left, right are triples (starts, targets, coefficient
+# indices) of arrays, the products for (r, s) being stored between
+# starts[r*n+s-1] and starts[r*n+s].
+
+action_tables = {}
+
+def build_action_tables(n):
+    """
+    Compute c_s * c_w and c_w * c_s for all f.c. elements w of H_n and all
+    generators s, and store them in action_tables[n]. From then on s_times_w
+    and w_times_s look up these products instead of computing them.
+
+    EXAMPLE:
+        sage: rows, coefficients, left, right = build_action_tables(4)
+        sage: len(rows)
+        sage: 195
+    """
+    if n in action_tables:
+        return action_tables[n]
+    rows = {}
+    coefficients = []
+    coefficient_ids = {}
+    tables = ([array('L',[0]), array('L'), array('L')],
+              [array('L',[0]), array('L'), array('L')])
+    for w in fc_elements(coxeter_matrix_H(n)):
+        rows[element_id(w)] = len(rows)
+        for s in range(1,n+1):
+            for (table,d) in zip(tables,(s_times_w(s,w),w_times_s(w,s))):
+                starts, targets, indices = table
+                for z in d:
+                    if d[z] not in coefficient_ids:
+                        coefficient_ids[d[z]] = len(coefficients)
+                        coefficients.append(d[z])
+                    targets.append(element_id(z))
+                    indices.append(coefficient_ids[d[z]])
+                starts.append(len(targets))
+    action_tables[n] = (rows, coefficients) + tables
+    return action_tables[n]
+
+def table_product(side,s,w):
+    """
+    Return c_s * c_w (side 0) or c_w * c_s (side 1) from a table built by
+    build_action_tables, or None if no table contains s and w.
+
+    EXAMPLE:
+        sage: build_action_tables(4)
+        sage: table_product(0,1,(2,3))
+        sage: {123: 1}
+    """
+    if not action_tables:
+        return None
+    key = element_id(w)
+    for n in action_tables:
+        rows, coefficients, left, right = action_tables[n]
+        if s <= n and key in rows:
+            starts, targets, indices = (left, right)[side]
+            r = rows[key]*n + s - 1
+            d = defaultdict(int)
+            for j in range(starts[r],starts[r+1]):
+                d[element_word(targets[j])] = coefficients[indices[j]]
+            return d
+    return None
+
+
 
 """ cells """
 
@@ -720,27 +1713,7 @@ def left_descendents(x,n):
         sage: left_descendents(1,2)
         sage: {1: [21], 21: [121,1], 2121: [121], 121: [2121, 21]} 
     """
-    w = canonical_word(x)
-    new_vertices = [w]
-    current_vertices = [w]
-    edges = defaultdict(list)
-    while new_vertices != []:
-        for z in new_vertices:
-            # print z
-            for s in range(1,n+1):
-                d = s_times_w(s,word_to_tuple(z))
-                for y in d:
-                    if y != z and (y not in edges[z]):
-                        edges[z] += [y]
-                        # print s, y
-                        if y not in current_vertices:
-                            new_vertices = new_vertices + [y]
-                            current_vertices = current_vertices + [y]
-            new_vertices.remove(z)  
-    d = defaultdict(list)
-    for vert in edges:                # convert all tuples to words
-        d[vert] = sorted(edges[vert])
-    return OrderedDict(sorted(d.items(),key=lambda t: t[0]))
+    return graph_dict(cell_graph(x,n,(0,)))
 
 def descendents(x,n):
     """
@@ -766,35 +1739,400 @@ def descendents(x,n):
         sage: left_descendents(1,2)
         sage: {1: [21], 21: [121,1], 2121: [121], 121: [2121, 21]} 
     """
-    w = canonical_word(x)
-    new_vertices = [w]
-    current_vertices = [w]
-    edges = defaultdict(list)
-    while new_vertices != []:
-        for z in new_vertices:
+    return graph_dict(cell_graph(x,n,(0,1)))
+
+
+""" cell graphs, as arrays """
+
+def cell_graph(x,n,sides=(0,)):
+    """
+    Return the graph of elements reached from x in H_n by multiplying on the
+    left (sides (0,)) or on both sides (sides (0,1)) by all c_s.
+
+    OUTPUT:
+    -- a triple (vertices, starts, targets): vertices lists element ids in the
+    order found, vertices[0] being x, and the edges out of vertices[i] go to
+    the vertices with indices targets[starts[i]:starts[i+1]]. Loops are left
+    out.
+
+    NOTE:
+    The vertices are expanded in the order they are found, so the list of
+    vertices is itself the breadth-first queue and the edges come out already
+    sorted by source.
+
+    EXAMPLE:
+        sage: cell_graph(1,2)
+        sage: ([0, 1, 2, 3], array('L', [0, 1, 3, 5, 6]),
+        array('L', [1, 2, 0, 3, 1, 2]))
+    """
+    return grow_cell_graph(([],array('L',[0]),array('L')),[x],n,sides)
+
+CHECKPOINT_EVERY = 10000
+
+def grow_cell_graph(graph,roots,n,sides=(0,),checkpoint=None,
+                    every=CHECKPOINT_EVERY):
+    """
+    Add the elements in roots to a graph from cell_graph, together with all
+    the elements reached from them, and return the graph.
+
+    If checkpoint is a file name, the graph is saved there with
+    save_cell_graph, together with the rank n, after every `every` vertices
+    and at the end.
+
+    NOTE:
+    The arrays of graph are extended in place. The vertices already in the
+    graph have been expanded, so only the new ones are multiplied. In
+    particular the graph is the whole state of the search: the vertices
+    past the last one expanded form the queue, and a search interrupted
+    after a checkpoint resumes with
+
+        sage: grow_cell_graph(load_cell_graph(checkpoint),[],n,sides,checkpoint)
+    """
+    vertices, starts, targets = graph
+    index = dict((vertices[i],i) for i in range(len(vertices)))
+    for x in roots:
+        if element_id(x) not in index:
+            index[element_id(x)] = len(vertices)
+            vertices.append(element_id(x))
+    i = len(starts) - 1
+    while i < len(vertices):
+        z = vertices[i]
+        out = set()
+        for side in sides:
             for s in range(1,n+1):
-                d = s_times_w(s,word_to_tuple(z))
-                for y in d:
-                    if y != z and (y not in edges[z]):
-                        edges[z] += [y]
-                        # print s, y
-                        if y not in current_vertices:
-                            new_vertices = new_vertices + [y]
-                            current_vertices = current_vertices + [y]
-                dd = w_times_s(word_to_tuple(z),s)
-                for y in dd:
-                    if y != z and (y not in edges[z]):
-                        edges[z] += [y]
-                        # print s, y
-                        if y not in current_vertices:
-                            new_vertices = new_vertices + [y]
-                            current_vertices = current_vertices + [y]
-            new_vertices.remove(z)  
-    d = defaultdict(list)
-    for vert in edges:                # convert all tuples to words
-        d[vert] = sorted(edges[vert])
+                for y in product_ids(side,s,z):
+                    if y == z or y in out:
+                        continue
+                    out.add(y)
+                    if y not in index:
+                        index[y] = len(vertices)
+                        vertices.append(y)
+                    targets.append(index[y])
+        starts.append(len(targets))
+        i = i + 1
+        if checkpoint is not None and i % every == 0:
+            save_cell_graph((vertices,starts,targets),checkpoint,n)
+    if checkpoint is not None:
+        save_cell_graph((vertices,starts,targets),checkpoint,n)
+    return vertices, starts, targets
+
+def product_ids(side,s,z):
+    """
+    Return the ids of the elements appearing in c_s * c_z (side 0) or in
+    c_z * c_s (side 1), for the element with id z.
+    """
+    for n in action_tables:
+        rows, coefficients, left, right = action_tables[n]
+        if s <= n and z in rows:
+            starts, targets, indices = (left, right)[side]
+            r = rows[z]*n + s - 1
+            return targets[starts[r]:starts[r+1]]
+    w = element_word(z).letters()
+    d = s_times_w(s,w) if side == 0 else w_times_s(w,s)
+    return [element_id(y) for y in d]
+
+def graph_dict(graph):
+    """
+    Turn a graph from cell_graph into the dictionary used by left_descendents
+    and descendents.
+    """
+    vertices, starts, targets = graph
+    words = [element_word(z) for z in vertices]
+    d = dict((words[i], sorted(words[j] for j in targets[starts[i]:starts[i+1]]))
+             for i in range(len(words)))
     return OrderedDict(sorted(d.items(),key=lambda t: t[0]))
 
+def strongly_connected_components(starts,targets):
+    """
+    Return the strongly connected components of a graph given by arrays as in
+    cell_graph, as lists of vertex indices, in the order in which Tarjan's
+    algorithm completes them.
+
+    The depth-first search is run with an explicit stack, so there is no
+    recursion limit on the size of the graph. For a graph from cell_graph,
+    every vertex is reached from vertex 0, so the component of vertex 0 comes
+    last.
+
+    EXAMPLE:
+        sage: strongly_connected_components(*cell_graph(1,2)[1:])
+        sage: [[3, 2, 1, 0]]
+    """
+    N = len(starts) - 1
+    order = [-1] * N
+    low = [0] * N
+    on_stack = [False] * N
+    stack = []
+    components = []
+    count = 0
+    for root in range(N):
+        if order[root] != -1:
+            continue
+        order[root] = low[root] = count
+        count = count + 1
+        stack.append(root)
+        on_stack[root] = True
+        work = [[root,starts[root]]]
+        while work:
+            v, j = work[-1]
+            if j < starts[v+1]:
+                work[-1][1] = j + 1
+                u = targets[j]
+                if order[u] == -1:
+                    order[u] = low[u] = count
+                    count = count + 1
+                    stack.append(u)
+                    on_stack[u] = True
+                    work.append([u,starts[u]])
+                elif on_stack[u] and order[u] < low[v]:
+                    low[v] = order[u]
+            else:
+                work.pop()
+                if work and low[v] < low[work[-1][0]]:
+                    low[work[-1][0]] = low[v]
+                if low[v] == order[v]:
+                    component = []
+                    while True:
+                        u = stack.pop()
+                        on_stack[u] = False
+                        component.append(u)
+                        if u == v:
+                            break
+                    components.append(component)
+    return components
+
+def root_component(graph):
+    """
+    Return the sorted canonical words in the strongly connected component of
+    vertex 0 of a graph from cell_graph or parallel_cell_graph.
+    """
+    vertices, starts, targets = graph
+    component = strongly_connected_components(starts,targets)[-1]
+    return sorted(element_word(vertices[i]) for i in component)
+
+
+""" cell graphs, extended from H_{n-1} to H_n """
+
+def extend_cell_graph(graph,n,sides=(0,),checkpoint=None,
+                      every=CHECKPOINT_EVERY,state=None):
+    """
+    Given graph = cell_graph(x,n-1,sides), return cell_graph(x,n,sides), up
+    to the numbering of vertices.
+
+    If checkpoint is a file name, the partial graph is saved there with
+    save_cell_graph after every `every` vertices, together with the rank n
+    and the state (old, i): the number of vertices of the graph of H_{n-1}
+    and the number of vertices already multiplied. The complete graph is
+    saved there at the end, with the rank n only. An extension interrupted
+    after a checkpoint resumes with
+
+        sage: graph, n, state = load_checkpoint(checkpoint)
+        sage: extend_cell_graph(graph,n,sides,checkpoint,state=state)
+
+    NOTE:
+    c_s * c_w and c_w * c_s do not depend on the rank, so the edges found in
+    H_{n-1} are kept, the old vertices are only multiplied by c_n, and only
+    the new vertices, which all involve n, are multiplied by every c_s. The
+    old vertices keep their numbers; in particular x is still vertex 0.
+
+    EXAMPLE:
+        sage: g = cell_graph(13,4)
+        sage: len(extend_cell_graph(g,5,(0,))[0]) == len(cell_graph(13,5)[0])
+        sage: True
+    """
+    vertices, starts, targets = graph
+    old, i = state if state is not None else (len(vertices), 0)
+    vertices = list(vertices)
+    index = dict((vertices[j],j) for j in range(len(vertices)))
+    edges = [list(targets[starts[j]:starts[j+1]])
+             for j in range(len(starts)-1)]
+    while i < len(vertices):
+        z = vertices[i]
+        if i < old:
+            out = set(edges[i])
+            generators = [n]
+        else:
+            out = set()
+            edges.append([])
+            generators = range(1,n+1)
+        for side in sides:
+            for s in generators:
+                for y in product_ids(side,s,z):
+                    if y == z:
+                        continue
+                    if y not in index:
+                        index[y] = len(vertices)
+                        vertices.append(y)
+                    if index[y] not in out:
+                        out.add(index[y])
+                        edges[i].append(index[y])
+        i = i + 1
+        if checkpoint is not None and i % every == 0:
+            save_cell_graph(edge_arrays(vertices,edges),checkpoint,n,(old,i))
+    graph = edge_arrays(vertices,edges)
+    if checkpoint is not None:
+        save_cell_graph(graph,checkpoint,n)
+    return graph
+
+def edge_arrays(vertices,edges):
+    """
+    Return the graph (vertices, starts, targets) with the lists of targets
+    in edges, as in cell_graph.
+    """
+    starts = array('L',[0])
+    targets = array('L')
+    for out in edges:
+        targets.extend(out)
+        starts.append(len(targets))
+    return vertices, starts, targets
+
+def save_cell_graph(graph,filename,n=None,state=None):
+    """
+    Save a graph from cell_graph to a file, with its vertices as lists of
+    letters, so that it can be loaded in another session. The rank n of the
+    graph and the state of an unfinished extend_cell_graph are saved with
+    it, for load_checkpoint.
+
+    The graph is written to a temporary file first, which then replaces
+    filename, so an interrupted save leaves the previous file intact.
+    """
+    vertices, starts, targets = graph
+    with open(filename + '.tmp','wb') as f:
+        pickle.dump(([list(element_word(z).letters()) for z in vertices],
+                     starts,targets,n,state),f,2)
+    os.rename(filename + '.tmp',filename)
+
+def load_cell_graph(filename):
+    """
+    Load a graph saved by save_cell_graph.
+
+    EXAMPLE:
+        sage: g = cell_graph(13,6)
+        sage: save_cell_graph(g,'H6.graph')
+        sage: words = [element_word(z) for z in g[0]]
+        sage: [element_word(z) for z in load_cell_graph('H6.graph')[0]] == words
+        sage: True
+        sage: g = extend_cell_graph(load_cell_graph('H6.graph'),7)
+        sage: len(root_component(g))
+        sage: 54
+    """
+    return load_checkpoint(filename)[0]
+
+def load_checkpoint(filename):
+    """
+    Load a graph saved by save_cell_graph, with its rank and extension
+    state; both are None for files saved without them.
+    """
+    with open(filename,'rb') as f:
+        data = pickle.load(f)
+    words, starts, targets = data[:3]
+    n, state = data[3:] if len(data) == 5 else (None, None)
+    return ([element_id(w) for w in words], starts, targets), n, state
+
+
+""" cell graphs, explored in parallel """
+
+def parallel_cell_graph(x,n,sides=(0,),processes=None):
+    """
+    Return the same graph as cell_graph(x,n,sides), up to the numbering of
+    vertices, exploring it with a pool of worker processes.
+
+    EXAMPLE:
+        sage: g = parallel_cell_graph(13,5,processes=4)
+        sage: len(g[0]) == len(cell_graph(13,5)[0])
+        sage: True
+    """
+    return parallel_grow_cell_graph(([],array('L',[0]),array('L')),[x],n,
+                                    sides,processes)
+
+def parallel_grow_cell_graph(graph,roots,n,sides=(0,),processes=None):
+    """
+    Add the elements in roots to a graph from cell_graph, together with all
+    the elements reached from them, and return the graph, like
+    grow_cell_graph, exploring the new vertices with a pool of worker
+    processes.
+
+    NOTE:
+    The search is level-synchronous: the current frontier is split among the
+    workers by the id of each vertex, every worker multiplies the vertices
+    it owns by all c_s, and the parent merges the results, numbers the new
+    vertices and makes them the next frontier. Each vertex enters exactly one
+    frontier and is owned by exactly one worker, so none is expanded twice.
+    The workers are forked, so action tables built before the call are used
+    by all of them. The arrays of graph are extended in place.
+    """
+    if processes is None:
+        processes = cpu_count()
+    vertices, starts, targets = graph
+    index = dict((vertices[i],i) for i in range(len(vertices)))
+    for x in roots:
+        if element_id(x) not in index:
+            index[element_id(x)] = len(vertices)
+            vertices.append(element_id(x))
+    first = len(starts) - 1
+    frontier = vertices[first:]
+    edges = [None] * len(frontier)
+    pool = Pool(processes)
+    try:
+        while frontier:
+            shards = [[] for i in range(processes)]
+            for z in frontier:
+                shards[z % processes].append(element_word(z))
+            frontier = []
+            tasks = [(shard,n,sides) for shard in shards if shard]
+            for result in pool.map(expand_shard,tasks):
+                for (z,out) in result:
+                    found = set()
+                    out_targets = []
+                    for y in out:
+                        y = element_id(y)
+                        if y == element_id(z) or y in found:
+                            continue
+                        found.add(y)
+                        if y not in index:
+                            index[y] = len(vertices)
+                            vertices.append(y)
+                            edges.append(None)
+                            frontier.append(y)
+                        out_targets.append(index[y])
+                    edges[index[element_id(z)] - first] = out_targets
+    finally:
+        pool.close()
+        pool.join()
+    for out in edges:
+        targets.extend(out)
+        starts.append(len(targets))
+    return vertices, starts, targets
+
+def expand_shard(task):
+    """
+    Multiply every word in a shard by all c_s on the given sides; run by the
+    workers of parallel_cell_graph.
+    """
+    shard, n, sides = task
+    result = []
+    for z in shard:
+        w = z.letters()
+        out = []
+        for side in sides:
+            for s in range(1,n+1):
+                d = s_times_w(s,w) if side == 0 else w_times_s(w,s)
+                out.extend(d)
+        result.append((z,out))
+    return result
+
+def parallel_cell(w,n,processes=None):
+    """
+    Return the 2-sided cell in H_n of the element w (assuming a(w) = 2), like
+    cell(w,n), growing the graph with parallel_grow_cell_graph.
+
+    EXAMPLE:
+        sage: len(parallel_cell(13,7,processes=4))
+        sage: 1458
+    """
+    grow = lambda g,r: parallel_grow_cell_graph(g,r,n,(0,),processes)
+    empty = ([],array('L',[0]),array('L'))
+    return sorted(itertools.chain(*closure_left_cells(empty,w,grow)[1]))
+
 
 def left_graph(w,n):
     """
@@ -850,9 +2188,7 @@ def left_cell(w,n):
         543212132143]
 
     """
-    y = canonical_word(w)
-    d = left_graph(y,n)
-    return sorted(d.strongly_connected_component_containing_vertex(y))
+    return root_component(cell_graph(w,n,(0,)))
 
 def cell(w,n): 
     """
@@ -870,10 +2206,72 @@ def cell(w,n):
         3212143, 4321213, 4321543, 4532143, 12132143, 32121543, 53212143,
         54321213, 212132143, 432121543, 453212143, 3212132143, 43212132143,
         543212132143]
-    """
-    y = canonical_word(w)
-    d = descendents_graph(y,n)
-    return sorted(d.strongly_connected_component_containing_vertex(y))
+
+        sage: data = open('KL_cells/H4').read().split('2-sided cells:')[1]
+        sage: line = [l for l in data.splitlines() if '{13,' in l][0]
+        sage: words = line[line.index('{')+1:-1].split(',')
+        sage: sorted(canonical_word(int(x)) for x in words) == cell(13,4)
+        sage: True
+
+    NOTE:
+    The 2-sided cell is the smallest union of left cells that contains w and
+    is closed under taking inverses, since the right cell of x is the inverse
+    of the left cell of x^{-1}. So only left multiplications are computed:
+    the left cells are read off a single graph that grows by the inverses of
+    the elements found so far, until no new ones appear.
+
+    This assumes that the relation ~_LR is generated by ~_L and ~_R, and in
+    particular that x ~_LR x^{-1}. Both hold in finite Coxeter groups
+    (Lusztig, Hecke algebras with unequal parameters, 14.2, P4 and P9-P11,
+    with H_3 and H_4 checked by computation), as the example against
+    KL_cells/H4 shows, and for the elements of a-value 2 in H_n, whose cells
+    are described in Green-Xu, Kazhdan-Lusztig cells of a-value 2 in
+    a(2)-finite Coxeter systems.
+    """
+    empty = ([],array('L',[0]),array('L'))
+    lcells = closure_left_cells(empty,w,lambda g,r: grow_cell_graph(g,r,n))[1]
+    return sorted(itertools.chain(*lcells))
+
+def closure_left_cells(graph,w,grow):
+    """
+    Grow a graph of left multiplications, as from cell_graph with sides (0,),
+    until it holds the 2-sided cell of w, and return the pair (graph, lcells)
+    of the grown graph and the left cells in the 2-sided cell of w, as sorted
+    lists of canonical words in the order of their first elements.
+
+    INPUT:
+    -- 'grow': a function such that grow(graph,roots) adds roots to graph,
+    together with all the elements reached from them, and returns the graph,
+    like grow_cell_graph for a fixed rank
+
+    NOTE:
+    The left cells are the strongly connected components of the roots, and
+    the inverses of their elements are the roots of the next round; see
+    cell. The vertices already expanded have all their targets in the graph,
+    so their components do not change when the graph grows.
+    """
+    members = set()
+    lcells = []
+    roots = [canonical_word(w)]
+    while roots:
+        graph = grow(graph,roots)
+        vertices, starts, targets = graph
+        index = dict((vertices[i],i) for i in range(len(vertices)))
+        component_of = {}
+        for c in strongly_connected_components(starts,targets):
+            for i in c:
+                component_of[i] = c
+        new = []
+        for x in roots:
+            c = component_of[index[element_id(x)]]
+            if vertices[c[0]] in members:
+                continue
+            lcells.append(sorted(element_word(vertices[i]) for i in c))
+            for i in c:
+                members.add(vertices[i])
+                new.append(inverse(element_word(vertices[i])))
+        roots = [y for y in new if element_id(y) not in members]
+    return graph, sorted(lcells)
 
 def right_cell(w,n):
     """
@@ -929,7 +2327,7 @@ def monomial_times_y(t,y):
         sage: {1213: 1, 13:1}
     """
     d = defaultdict(int)
-    d[y] = 1 
+    d[Word(y)] = 1 
     for s in reversed(t):
         s_times_d = defaultdict(int)
         for w in d:
@@ -941,6 +2339,79 @@ def monomial_times_y(t,y):
 
 
 
+def s_times_vector(s,d):
+    """
+    Return c_s * d for a linear combination d of KL basis elements.
+
+    EXAMPLE:
+        sage: s_times_vector(1,{23:1, 3:2})
+        sage: {123:1, 13:2}
+    """
+    e = defaultdict(int)
+    for w in d:
+        dd = s_times_w(s,word_to_tuple(w))
+        for term in dd:
+            e[term] += dd[term] * d[w]
+    return e
+
+def factor_rule(i):
+    """
+    Return the triple (prefix, tail, c) such that the factor i (one of A,
+    ..., F) is c_tail * c_prefix + c * c_prefix, where c_t for a tuple t is
+    the product of the c_s for s in t; return None if i is a letter.
+
+    EXAMPLE:
+        sage: factor_rule(D)
+        sage: ((1,2), (1,2), -2)
+    """
+    if i == A:       # c1c2 - 1
+        return (), (1,2), -1
+    elif i == B:     # c1c2c1 - c1
+        return (1,), (1,2), -1
+    elif i == C:     # c2c1c2 - c2
+        return (2,), (2,1), -1
+    elif i == D:     # c1c2c1c2 - 2c1c2
+        return (1,2), (1,2), -2
+    elif i == E:     # c2c1c2 - 2c2
+        return (2,), (2,1), -2
+    elif i == F:     # c2c1c2c1 - 2c2c1
+        return (2,1), (2,1), -2
+    return None
+
+def apply_factor(i,d,times):
+    """
+    Return the product of a factor i of an f-basis vector and a vector d,
+    where times(s,d) multiplies a vector by c_s.
+
+    NOTE:
+    Each of A, ..., F is c_u c_t ... minus a multiple of a shorter product
+    ending the same way, so the shorter product is computed once and reused.
+    """
+    rule = factor_rule(i)
+    if rule is None:
+        return times(i,d)
+    prefix, tail, c = rule
+    e = d
+    for t in reversed(prefix):
+        e = times(t,e)
+    f = e
+    for t in reversed(tail):
+        f = times(t,f)
+    for w in e:
+        f[w] += c * e[w]
+    return f
+
+def factor_times_vector(i,d):
+    """
+    Return the product of a factor i of an f-basis vector (a letter, or one of
+    A, ..., F) and a linear combination d of KL basis elements.
+
+    EXAMPLE:
+        sage: factor_times_vector(A,{3:1})
+        sage: {123:1, 3:-1}
+    """
+    return apply_factor(i,d,s_times_vector)
+
 def x_times_y(x,y):
     """
     Compute c_x * c_y modulo linear combinations of elements c_z where a(z)>2.
@@ -948,6 +2419,11 @@ def x_times_y(x,y):
     INPUT:
     -- 'x', 'y': reduced words of elements of a-value at most 2
 
+    NOTE:
+    The f-basis vector of x is a product of factors, each a letter s or one
+    of A, ..., F (see ffactors). Rather than expanding it into monomials, the
+    factors are applied to c_y one at a time, from right to left.
+
     EXAMPLE:
         sage: x_times_y(121,1212)
         sage: {12: v + 1/v}
@@ -955,12 +2431,10 @@ def x_times_y(x,y):
         sage: x_times_y(132143,132143)
         sage: {132413: (v+1/v)^2, 13: (v+1/v)^2}
     """
-    poly = factor_to_poly(ffactors(word_to_tuple(x)))
     d = defaultdict(int)
-    for m in poly:
-        dd = monomial_times_y(m,y)
-        for term in dd:
-            d[term] += poly[m] * dd[term]
+    d[canonical_word(y)] = 1
+    for i in reversed(justification(x)[1]):
+        d = factor_times_vector(i,d)
     for k in list(d):
         if d[k] == 0:
             del d[k]
@@ -984,35 +2458,162 @@ def a2_pairs(n):
         d += [list_or_tuple_to_word((i,j)) for j in range(i+2,n+1)]
     return d
 
-def a2_cells(n):
+def a2_cells(n,graph=None,store='mysagecode/a2cells.jsonl',checkpoint=None):
     """
-    Partition the 2-sided cell of a-value 2 in H_n into left cells.
+    Partition the 2-sided cell of a-value 2 in H_n into left cells, and
+    record the left cells, their intersections with their inverses and their
+    distinguished involutions in the file store.
+
+    Only left multiplications are computed: the left cells are read off a
+    graph of left multiplications that grows by inverses until it holds the
+    2-sided cell, as in cell. If graph is that graph for H_{n-1}, as returned
+    by the previous call, it is extended to H_n rather than computed again.
+    The graph of H_n is returned, so a sweep over ranks can run as
+
+        sage: graph = None
+        sage: for n in range(3,9): graph = a2_cells(n,graph)
+
+    If checkpoint is a file name, the graph of H_n is saved there, with its
+    rank, as it is found, and a later call with the same checkpoint and no
+    graph resumes from it. A checkpoint holding the complete graph of
+    H_{n-1} is extended instead, and any other checkpoint raises a
+    ValueError. The store is read first, and the left cells of H_n already
+    recorded there are not done again, so an interrupted run is resumed by
+    calling a2_cells again with the same arguments. The text file of earlier
+    versions is written from the store by render_a2_cells.
 
     NOTE:
+    The store has one JSON object per line: a line with keys rank, size and
+    cells for the 2-sided cell of H_n, written once the left cells are
+    known, and then a line with keys rank, cell, elements, intersection and
+    involution for each left cell, written as soon as its distinguished
+    involution is found. Words are written as lists of letters.
+
     The cardinality of the 2-sided cell with a-value 2 is 25, 162 = 2 * 9^2,
     392 = 2 * 14^2, 800 = 2 * 20^2, 1458 = 2 * 27^2 for H3, H4, H5, H6, H7,
     respectively.
     """
-    C = cell(13,n)
-    l = len(C)
-    lcells = left_cells_in(C,n)
-    k = len(lcells)
-    intersections = [Set(c).intersection(Set(cell_inverse(c))) for c in lcells]
-    with open('mysagecode/a2cells.txt','a+') as f:
-        f.write("************** H" + str(n) + " *****************\n\n")
-        f.write("The 2-sided cell of a-value 2 in H" + str(n) + " has " +
-                str(l) + " elements.\n\n")
-        f.write("The cell consists of " + str(k) + " left cells. For each cell,\nwe list its elements, its intersection with its inverse,\nand its unique distinguished involution below. \n\n")
-        for i in range(k):
-            f.write("Cell " + str(i+1) + ": ")
-            f.write("%s" % lcells[i])
-            f.write(".\n")
-            f.write("The intersection: ")
-            f.write("%s" % intersections[i])
-            f.write(".\n")
-            f.write("The distinguished involution: ")
-            f.write("%s" % dist_inv(list(intersections[i])))
-            f.write(".\n\n")
+    if checkpoint is not None and graph is None and os.path.exists(checkpoint):
+        graph, rank, state = load_checkpoint(checkpoint)
+        complete = state is None and len(graph[1]) == len(graph[0]) + 1
+        if rank == n and state is not None:
+            graph = extend_cell_graph(graph,n,(0,),checkpoint,state=state)
+        elif rank == n:
+            graph = grow_cell_graph(graph,[],n,(0,),checkpoint)
+        elif rank == n-1 and complete:
+            graph = extend_cell_graph(graph,n,(0,),checkpoint)
+        else:
+            raise ValueError("%s does not hold a graph of H_%s or all of H_%s"
+                             % (checkpoint,n,n-1))
+    elif graph is not None:
+        graph = extend_cell_graph(graph,n,(0,),checkpoint)
+    else:
+        graph = ([],array('L',[0]),array('L'))
+    grow = lambda g,r: grow_cell_graph(g,r,n,(0,),checkpoint)
+    graph, lcells = closure_left_cells(graph,13,grow)
+    C = list(itertools.chain(*lcells))
+    cell_of = {}
+    for k in range(len(lcells)):
+        for w in lcells[k]:
+            cell_of[w] = k
+    intersections = [[w for w in lcells[k]
+                      if cell_of[canonical_word(inverse(w))] == k]
+                     for k in range(len(lcells))]
+    done = load_a2_store(store).get(n,{'cells':{}})
+    with open_store(store) as f:
+        if 'size' not in done:
+            write_record(f,{'rank':n,'size':len(C),'cells':len(lcells)})
+        for i in range(len(lcells)):
+            if i in done['cells']:
+                continue
+            involution = distinguished_involution(lcells[i])
+            write_record(f,{'rank':n,'cell':i,
+                            'elements':[list(w.letters()) for w in lcells[i]],
+                            'intersection':[list(w.letters())
+                                            for w in intersections[i]],
+                            'involution':list(involution.letters())})
+    return graph
+
+def open_store(store):
+    """
+    Open a store for appending, ending first a line cut short by an
+    interrupted run.
+    """
+    if os.path.exists(store) and os.path.getsize(store) > 0:
+        with open(store,'rb') as f:
+            f.seek(-1,2)
+            last = f.read(1)
+        if last != b'\n':
+            with open(store,'a') as f:
+                f.write('\n')
+    return open(store,'a')
+
+def write_record(f,record):
+    """
+    Append a record to an open store as one line of JSON, and flush it.
+    """
+    f.write(json.dumps(record,sort_keys=True) + '\n')
+    f.flush()
+
+def load_a2_store(store):
+    """
+    Read a store written by a2_cells.
+
+    OUTPUT:
+    -- a dictionary sending each rank n to a dictionary with the keys size
+    and count, the numbers of elements and of left cells of the 2-sided cell
+    of H_n, and cells, which sends i to the triple (left cell, intersection,
+    distinguished involution) of the i-th left cell, with words as Words. A
+    line cut short by an interrupted run is skipped.
+    """
+    ranks = {}
+    if not os.path.exists(store):
+        return ranks
+    with open(store) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            r = ranks.setdefault(record['rank'],{'cells':{}})
+            if 'size' in record:
+                r['size'] = record['size']
+                r['count'] = record['cells']
+            else:
+                r['cells'][record['cell']] = (
+                    [Word(w) for w in record['elements']],
+                    [Word(w) for w in record['intersection']],
+                    Word(record['involution']))
+    return ranks
+
+def render_a2_cells(store='mysagecode/a2cells.jsonl',
+                    filename='mysagecode/a2cells.txt'):
+    """
+    Append the text written by earlier versions of a2_cells to filename, for
+    every rank recorded completely in store.
+    """
+    ranks = load_a2_store(store)
+    with open(filename,'a+') as f:
+        for n in sorted(ranks):
+            r = ranks[n]
+            if 'size' not in r or len(r['cells']) < r['count']:
+                continue
+            l, k = r['size'], r['count']
+            f.write("************** H" + str(n) + " *****************\n\n")
+            f.write("The 2-sided cell of a-value 2 in H" + str(n) + " has " +
+                    str(l) + " elements.\n\n")
+            f.write("The cell consists of " + str(k) + " left cells. For each cell,\nwe list its elements, its intersection with its inverse,\nand its unique distinguished involution below. \n\n")
+            for i in range(k):
+                lcell, intersection, involution = r['cells'][i]
+                f.write("Cell " + str(i+1) + ": ")
+                f.write("%s" % lcell)
+                f.write(".\n")
+                f.write("The intersection: ")
+                f.write("%s" % Set(intersection))
+                f.write(".\n")
+                f.write("The distinguished involution: ")
+                f.write("%s" % involution)
+                f.write(".\n\n")
 
 
 def left_cells_in(C,n):
@@ -1027,14 +2628,234 @@ def left_cells_in(C,n):
  			   [13212, 213212, 1213212, 21213212, 321213212],
  			   [132123, 2132123, 12132123, 212132123, 3212132123]]
     """
-    remain = C
-    l = []
-    while remain != []:
-        w = remain[0]
-        lcell = left_cell(w,n)
-        remain = [i for i in remain if i not in lcell]
-        l = l + [lcell]
-    return l
+    return left_cell_partition(C,n)[0]
+
+def cell_partition(C,n):
+    """
+    Partition a 2-sided cell C of H_n into left cells, and find, for each left
+    cell, its intersection with its inverse and its distinguished involution.
+
+    OUTPUT:
+    -- a triple (lcells, intersections, involutions) of lists, the left cells
+    being sorted and listed in the order of their first elements in C.
+
+    NOTE:
+    Two elements of C lie in the same left cell exactly when they lie in the
+    same strongly connected component of the graph on C given by left
+    multiplication: an element on a path from x to y and back again is in
+    the left cell of x, hence in C. So one graph over C, one pass of
+    strongly_connected_components, and the component of every element and of
+    its inverse give the whole partition.
+
+    EXAMPLE:
+        sage: cell_partition(cell(13,3),3)[2]
+        sage: [13, 2132, 121321, 21213212, 3212132123]
+    """
+    lcells, intersections = left_cell_partition(C,n)
+    return lcells, intersections, distinguished_involutions(lcells)
+
+def left_cell_partition(C,n):
+    """
+    Return the pair (lcells, intersections) of cell_partition(C,n), without
+    the distinguished involutions.
+    """
+    words = [canonical_word(w) for w in C]
+    ids = [element_id(w) for w in words]
+    index = dict((ids[i],i) for i in range(len(ids)))
+    starts = array('L',[0])
+    targets = array('L')
+    for z in ids:
+        out = set()
+        for s in range(1,n+1):
+            for y in product_ids(0,s,z):
+                if y != z and y in index and y not in out:
+                    out.add(y)
+                    targets.append(index[y])
+        starts.append(len(targets))
+    components = sorted(sorted(c) for c in
+                        strongly_connected_components(starts,targets))
+    component_of = {}
+    for k in range(len(components)):
+        for i in components[k]:
+            component_of[ids[i]] = k
+    lcells = [sorted(words[i] for i in c) for c in components]
+    intersections = [[w for w in lcells[k]
+                      if component_of[element_id(inverse(w))] == k]
+                     for k in range(len(components))]
+    return lcells, intersections
+
+""" left cells from star operations """
+
+# For m(s,t) >= 3, let D_L(s,t) be the set of x with exactly one of s, t in
+# L(x). If x and sx both lie in D_L(s,t), then c_s c_x contains c_sx and c_t
+# c_sx (or c_t c_x) contains the other one with coefficient mu = 1, so x and
+# sx are in the same left cell; these steps walk along Lusztig's left
+# strings, and for m(s,t) = 3 they are the (left) star operations. On the
+# other side, R(x) is constant on left cells, and for m(s,t) = 3 and x, y in
+# D_R(s,t), x ~_L y implies x* ~_L y* [KL79, 4.3], which gives Vogan's
+# generalized tau-invariant. Left strings glue elements together and the
+# tau-invariant tells groups apart; only groups that it cannot tell apart
+# need products c_s c_w.
+
+def descents(w):
+    """
+    Return the pair (L(w), R(w)) of left and right descent sets of a
+    fully-commutative element w of type H, read from the minimal and the
+    maximal elements of its heap.
+
+    EXAMPLE:
+        sage: descents(1323)
+        sage: ({1, 3}, {3})
+    """
+    t = word_to_tuple(w) if w else ()
+    first = {}
+    last = {}
+    for i in range(len(t)):
+        first.setdefault(t[i],i)
+        last[t[i]] = i
+    left = set(s for s in first if all(first[s] < first.get(u,len(t))
+                                       for u in (s-1,s+1)))
+    right = set(s for s in last if all(last[s] > last.get(u,-1)
+                                       for u in (s-1,s+1)))
+    return left, right
+
+def fc_times_s(side,s,w,n):
+    """
+    Return the canonical word of sw (side 0) or ws (side 1) for a
+    fully-commutative element w of H_n, or None if it is not
+    fully-commutative.
+
+    EXAMPLE:
+        sage: fc_times_s(0,2,13,3)
+        sage: 213
+
+        sage: fc_times_s(1,1,1323,3)
+        sage:
+    """
+    t = _times_s_tuple(side,s,word_to_tuple(w) if w else (),descents(w))
+    if not is_fc_word(t,coxeter_matrix_H(n)):
+        return None
+    return canonical_word(t)
+
+def _times_s_tuple(side,s,t,desc):
+    """
+    Return a word of sw (side 0) or ws (side 1), for a word t of a
+    fully-commutative element w with descent sets desc, by removing the
+    first (last) s if it is a descent and adding one otherwise.
+    """
+    u = t[::-1] if side else t
+    if s in desc[side]:
+        i = u.index(s)
+        u = u[:i] + u[i+1:]
+    else:
+        u = (s,) + u
+    return u[::-1] if side else u
+
+def star_cell_partition(C,n):
+    """
+    Return the pair (lcells, intersections) of left_cell_partition(C,n) for a
+    2-sided cell C of H_n consisting of fully-commutative elements, computed
+    mostly from star operations.
+
+    NOTE:
+    A union-find joins x and sx along left strings. The classes are then
+    told apart by the generalized tau-invariant, refined until it no longer
+    splits them, and a class whose invariant no other class shares is a left
+    cell. The classes that share an invariant are split into left cells as
+    in left_cell_partition, by products c_s c_w among their elements. Right
+    star operations move within right cells, so they stay in C. A product
+    sw or ws is looked up in C by the reading of its heap, so a word that is
+    not fully-commutative is never found there and needs no test.
+
+    EXAMPLE:
+        sage: star_cell_partition(cell(13,3),3)[0] == left_cells_in(cell(13,3),3)
+        sage: True
+    """
+    words = [canonical_word(w) for w in C]
+    index = dict((words[i],i) for i in range(len(words)))
+    pairs = [(s,s+1) for s in range(1,n)]
+    desc = [descents(w) for w in words]
+    times = lambda side,s,i: Word(heap_canonical_tuple(
+        _times_s_tuple(side,s,words[i].letters(),desc[i])))
+    # left strings
+    parent = list(range(len(words)))
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+    for i in range(len(words)):
+        for (s,t) in pairs:
+            if len(desc[i][0].intersection((s,t))) != 1:
+                continue
+            for u in (s,t):
+                j = index.get(times(0,u,i))
+                if j is not None and len(desc[j][0].intersection((s,t))) == 1:
+                    parent[find(i)] = find(j)
+    # right star operations, for the pairs with m(s,t) = 3
+    star = []
+    for i in range(len(words)):
+        images = []
+        for (s,t) in pairs[1:]:
+            if len(desc[i][1].intersection((s,t))) != 1:
+                continue
+            for u in (s,t):
+                j = index.get(times(1,u,i))
+                if j is not None and len(desc[j][1].intersection((s,t))) == 1:
+                    images.append(j)
+                    break
+            else:
+                raise ValueError("C is not a 2-sided cell")
+        star.append(images)
+    # the generalized tau-invariant, as a partition refined until it is
+    # stable
+    labels = {}
+    tau = [labels.setdefault(tuple(sorted(d[1])),len(labels)) for d in desc]
+    while True:
+        labels = {}
+        new = [labels.setdefault((tau[i],tuple(tau[j] for j in star[i])),
+                                 len(labels)) for i in range(len(words))]
+        if len(labels) == len(set(tau)):
+            break
+        tau = new
+    # the classes, grouped by invariant
+    classes = defaultdict(list)
+    for i in range(len(words)):
+        classes[find(i)].append(i)
+    groups = defaultdict(list)
+    for c in classes.values():
+        groups[tau[c[0]]].append(c)
+    components = []
+    for g in groups.values():
+        if len(g) == 1:
+            components.append(g[0])
+        else:
+            members = [i for c in g for i in c]
+            ids = [element_id(words[i]) for i in members]
+            local = dict((ids[k],k) for k in range(len(ids)))
+            starts = array('L',[0])
+            targets = array('L')
+            for z in ids:
+                out = set()
+                for s in range(1,n+1):
+                    for y in product_ids(0,s,z):
+                        if y != z and y in local and y not in out:
+                            out.add(y)
+                            targets.append(local[y])
+                starts.append(len(targets))
+            for c in strongly_connected_components(starts,targets):
+                components.append([members[k] for k in c])
+    components = sorted(sorted(c) for c in components)
+    component_of = {}
+    for k in range(len(components)):
+        for i in components[k]:
+            component_of[words[i]] = k
+    lcells = [sorted(words[i] for i in c) for c in components]
+    intersections = [[w for w in lcells[k]
+                      if component_of[canonical_word(inverse(w))] == k]
+                     for k in range(len(components))]
+    return lcells, intersections
+
 
 """ distinguished involutions """
 
@@ -1062,3 +2883,226 @@ def dist_inv(l):
     return list(S)[0]
 
 
+
+
+""" leading terms of products, and distinguished involutions """
+
+laurent_cache = {}
+
+def laurent_terms(c):
+    """
+    Return a Laurent polynomial c in v as a dictionary {degree: coefficient}.
+
+    EXAMPLE:
+        sage: laurent_terms(v + v^(-1))
+        sage: {-1: 1, 1: 1}
+    """
+    if c not in laurent_cache:
+        laurent_cache[c] = dict((int(e),int(k)) for (k,e) in
+                                SR(c).expand().coefficients(v))
+    return laurent_cache[c]
+
+def s_times_graded(s,d):
+    """
+    Return c_s * d for a vector d given as a dictionary {(w, degree): integer}.
+    """
+    e = defaultdict(int)
+    for (w,k) in d:
+        dd = s_times_w(s,word_to_tuple(w))
+        for z in dd:
+            for (j,m) in laurent_terms(dd[z]).items():
+                e[(z,k+j)] += m * d[(w,k)]
+    return e
+
+def top_terms(x,y,degree=2):
+    """
+    Return the coefficients of v^degree in c_x * c_y, as a dictionary
+    sending z to the coefficient of v^degree in h_{x,y,z}, for the nonzero
+    ones.
+
+    NOTE:
+    The vector is kept with integer coefficients, graded by the degree in v.
+    Multiplying by c_s raises degrees by at most 1, so a factor of the
+    f-basis vector of x raises them by at most its number of letters, and
+    once the factors still to be applied cannot lift a term to the given
+    degree, the term is dropped.
+
+    EXAMPLE:
+        sage: top_terms(31,13)
+        sage: {13: 1}
+    """
+    factors = justification(x)[1]
+    raises = [0]
+    for f in factors:
+        rule = factor_rule(f)
+        raises.append(raises[-1] + (1 if rule is None else
+                                    len(rule[0]) + len(rule[1])))
+    d = {(canonical_word(y),0): 1}
+    for k in reversed(range(len(factors))):
+        d = apply_factor(factors[k],d,s_times_graded)
+        d = dict((key,c) for (key,c) in d.items()
+                 if c != 0 and key[1] + raises[k] >= degree)
+    return dict((w,c) for ((w,e),c) in d.items() if e == degree)
+
+def distinguished_involutions(lcells):
+    """
+    Return the distinguished involution of every left cell in lcells, a list
+    of left cells of a-value 2.
+
+    NOTE:
+    The distinguished involution d of the left cell of x is the involution
+    with gamma_{x^{-1},x,d} != 0, i.e., with a term v^2 c_d in c_{x^{-1}}c_x.
+    Only these top terms are computed, with top_terms, for the elements of
+    the cell in order until one candidate is left.
+
+    EXAMPLE:
+        sage: distinguished_involutions(left_cells_in(cell(13,3),3))
+        sage: [13, 2132, 121321, 21213212, 3212132123]
+    """
+    return [distinguished_involution(l) for l in lcells]
+
+def distinguished_involution(l):
+    """
+    Return the distinguished involution of a left cell l of a-value 2, as in
+    distinguished_involutions.
+    """
+    S = None
+    for x in l:
+        T = set(z for z in top_terms(inverse(x),x)
+                if canonical_word(inverse(z)) == z)
+        S = T if S is None else S.intersection(T)
+        if len(S) == 1:
+            break
+    return min(S)
+
+
+""" structure constants in the 2-sided cell of a-value 2 """
+
+def a2_structure_constants(n,C=None):
+    """
+    Compute c_x * c_y for all x, y in the 2-sided cell C of a-value 2 in H_n,
+    modulo the c_z with a(z) > 2, together with Lusztig's gamma_{x,y,d}.
+
+    OUTPUT:
+    -- a dictionary with keys
+       'rank': n,
+       'elements': the list C,
+       'x', 'y', 'z', 'h': parallel lists, with h[k] = h_{x,y,z} for the
+       elements of indices x[k], y[k], z[k] in C (only the nonzero ones),
+       'gamma': a dictionary sending the index triple of (x,y,d) to
+       gamma_{x,y,d}, the coefficient of v^2 in h_{x,y,d^{-1}}, for the
+       nonzero ones.
+
+    NOTE:
+    The products are computed as in x_times_y, for all y at once: the x are
+    sorted by their f-basis factors read from the right, and the vectors
+    obtained from the c_y by applying a common run of factors are kept on a
+    stack and shared by all the x with that run. Terms outside C are dropped
+    after each factor, since they have a-value above 2 and stay there.
+
+    EXAMPLE:
+        sage: t = a2_structure_constants(3)
+        sage: len(t['h']), len(t['gamma'])
+        sage: (325, 125)
+    """
+    if C is None:
+        C = a2_cell_direct(n)[0]
+    C = [canonical_word(w) for w in C]
+    index = dict((C[i],i) for i in range(len(C)))
+    inverses = [index[canonical_word(inverse(w))] for w in C]
+    keyed = sorted((tuple(str(f) for f in reversed(justification(w)[1])),w)
+                   for w in C)
+    table = {'rank': n, 'elements': C, 'x': array('L'), 'y': array('L'),
+             'z': array('L'), 'h': [], 'gamma': {}}
+    stack = [[{w: 1} for w in C]]
+    previous = ()
+    for key, x in keyed:
+        common = 0
+        while (common < min(len(key),len(previous)) and
+               key[common] == previous[common]):
+            common = common + 1
+        del stack[common+1:]
+        factors = list(reversed(justification(x)[1]))
+        for f in factors[common:]:
+            stack.append([dict((z,c) for (z,c) in
+                               factor_times_vector(f,d).items()
+                               if z in index and c != 0)
+                          for d in stack[-1]])
+        previous = key
+        i = index[x]
+        for j in range(len(C)):
+            d = stack[-1][j]
+            for z in d:
+                table['x'].append(i)
+                table['y'].append(j)
+                table['z'].append(index[z])
+                table['h'].append(d[z])
+                g = SR(d[z]).expand().coefficient(v,2)
+                if g != 0:
+                    table['gamma'][(i,j,inverses[index[z]])] = g
+    return table
+
+def save_structure_constants(table,filename):
+    """
+    Save a table from a2_structure_constants to a file, with the elements as
+    lists of letters and each h_{x,y,z} as a tuple of pairs (degree, coefficient).
+    """
+    data = dict(table)
+    data['elements'] = [list(w.letters()) for w in table['elements']]
+    data['h'] = [tuple((int(e),int(c)) for (c,e) in
+                       SR(h).expand().coefficients(v)) for h in table['h']]
+    data['gamma'] = dict((k,int(g)) for (k,g) in table['gamma'].items())
+    with open(filename,'wb') as f:
+        pickle.dump(data,f,2)
+
+def load_structure_constants(filename):
+    """
+    Load a table saved by save_structure_constants, and index it by pairs
+    (x,y) and by z for structure_constants and structure_constants_into.
+
+    EXAMPLE:
+        sage: save_structure_constants(a2_structure_constants(4),'H4.sc')
+        sage: t = load_structure_constants('H4.sc')
+        sage: structure_constants(t,13,13)
+        sage: {13: v^2 + 1/v^2 + 2}
+    """
+    with open(filename,'rb') as f:
+        table = pickle.load(f)
+    table['elements'] = [Word(w) for w in table['elements']]
+    table['h'] = [sum(c * v**e for (e,c) in terms) for terms in table['h']]
+    return index_structure_constants(table)
+
+def index_structure_constants(table):
+    """
+    Add to a table from a2_structure_constants the positions of its entries
+    by pair (x,y) and by z; return the table.
+    """
+    table['index'] = dict((table['elements'][i],i)
+                          for i in range(len(table['elements'])))
+    table['by_pair'] = defaultdict(list)
+    table['by_z'] = defaultdict(list)
+    for k in range(len(table['h'])):
+        table['by_pair'][(table['x'][k],table['y'][k])].append(k)
+        table['by_z'][table['z'][k]].append(k)
+    return table
+
+def structure_constants(table,x,y):
+    """
+    Return c_x * c_y modulo a > 2 from an indexed table, as a dictionary.
+    """
+    if 'by_pair' not in table:
+        index_structure_constants(table)
+    C = table['elements']
+    pair = (table['index'][canonical_word(x)],table['index'][canonical_word(y)])
+    return dict((C[table['z'][k]],table['h'][k]) for k in table['by_pair'][pair])
+
+def structure_constants_into(table,z):
+    """
+    Return the dictionary sending the pairs (x,y) with h_{x,y,z} != 0 to
+    h_{x,y,z}, from an indexed table.
+    """
+    if 'by_pair' not in table:
+        index_structure_constants(table)
+    C = table['elements']
+    return dict(((C[table['x'][k]],C[table['y'][k]]),table['h'][k])
+                for k in table['by_z'][table['index'][canonical_word(z)]])
@@ -0,0 +1,454 @@
+from conversions import Word
+
+""" Multiplication of Kazhdan-Lusztig basis elements indexed by
+fully-commutative elements in types A and B, in the generalized Temperley-Lieb
+quotient, without the full Coxeter group.
+
+The generators are labeled 1, ..., n along the Coxeter graph with the strong
+bond (m = 4 for type B) between 1 and 2, as in fc.py, so that c_s * c_w does
+not depend on n. Elements are tuples read off their heaps as in fc.py's
+canonical_word.
+
+Load fc.py first: the heaps (heap_canonical_tuple), the descents, the
+fully-commutative elements (fc_elements, and is_fc_word to test a word) and
+the strongly connected components are computed by the functions there. The
+functions below that fc.py also has for type H are named with a suffix _ab,
+so that loading this file does not replace them. """
+
+# The quotient of the Hecke algebra by the ideal J generated by the c_{w_0}
+# for the longest elements w_0 of the parabolic subgroups W_{s,t} with m(s,t)
+# >= 3 has the images t_w of the T_w, w fully-commutative, as a basis (Graham),
+# and J is spanned by the c_w with w not fully-commutative (Green-Losonczy).
+# So the images c_w of the c_w with w fully-commutative form a basis, which
+# is the canonical basis of the quotient in types A and B, and a product in
+# the Hecke algebra is computed in the quotient by dropping the terms that are
+# not fully-commutative. T_s acts on the t_w by the quadratic relation, and a
+# braid that appears is removed with c_{w_0} = 0, where c_{w_0} is the sum of
+# v^{m - l(y)} T_y over W_{s,t}.
+#
+# Laurent polynomials in v are dictionaries {degree: integer}; T_s satisfies
+# (T_s - v^{-1})(T_s + v) = 0 and c_s = T_s + v.
+
+var('v')
+
+
+""" Coxeter data """
+
+def bond(s,t,cartan='A'):
+    """
+    Return m(s,t) in the Coxeter group of the given type.
+
+    EXAMPLE:
+        sage: bond(1,2,'B')
+        sage: 4
+
+        sage: bond(1,3,'B')
+        sage: 2
+    """
+    if s == t:
+        return 1
+    if abs(s-t) > 1:
+        return 2
+    if cartan == 'B' and min(s,t) == 1:
+        return 4
+    return 3
+
+def coxeter_matrix(n,cartan='A'):
+    """
+    Return the Coxeter matrix of A_n or B_n in the labeling of this file.
+
+    EXAMPLE:
+        sage: coxeter_matrix(3,'B')
+        sage: [[1,4,2],[4,1,3],[2,3,1]]
+    """
+    return [[bond(s,t,cartan) for t in range(1,n+1)] for s in range(1,n+1)]
+
+
+""" heaps and descents """
+
+def to_tuple(w):
+    """
+    Return the letters of a word w (an integer, a Word or a tuple).
+
+    EXAMPLE:
+        sage: to_tuple(213)
+        sage: (2,1,3)
+    """
+    if not w:
+        return ()
+    return Word(w).letters()
+
+def left_parabolic(s,u,t):
+    """
+    Return the coset decomposition x * y of a fully-commutative element with
+    reduced word t, where x is in the parabolic subgroup generated by s and u,
+    and neither s nor u is a left descent of y.
+
+    EXAMPLE:
+        sage: left_parabolic(1,2,(2,1,3,2))
+        sage: ((2,1),(3,2))
+    """
+    x = ()
+    y = t
+    while True:
+        d = descents(y)[0]
+        if s in d:
+            a = s
+        elif u in d:
+            a = u
+        else:
+            return x, y
+        x = x + (a,)
+        y = remove_first(a,y)
+
+def braid(s,t,cartan='A'):
+    """
+    For a fully-commutative element w with reduced word t such that s is not a
+    left descent of w, return None if sw is fully-commutative, and otherwise a
+    quadruple (z, u, x, y) with t = z * x * y up to commutations, where the
+    letters of z commute with s and x is the alternating word u, s, u, ... of
+    length m(s,u) - 1, so that sx is the longest element of W_{s,u}.
+
+    NOTE:
+    In the heap of sw, the elements of w not above the new s form an order
+    ideal z of letters that commute with s. A convex chain s, u, s, ... of
+    length m(s,u) through the new s has nothing else below its elements
+    outside z, so it is a left factor of the rest of w.
+
+    EXAMPLE:
+        sage: braid(1,(2,1,2),'B')
+        sage: ((), 2, (2,1,2), ())
+
+        sage: braid(1,(3,2,1),'A')
+        sage: ((3,), 2, (2,1), ())
+
+        sage: braid(1,(2,3),'B')
+        sage:
+    """
+    z = []
+    rest = []
+    above = set()
+    for a in t:
+        if any(b in above for b in (a-1,a,a+1)) or abs(a-s) <= 1:
+            rest.append(a)
+            above.add(a)
+        else:
+            z.append(a)
+    rest = tuple(rest)
+    for u in (s-1,s+1):
+        m = bond(s,u,cartan)
+        if u < 1 or m < 3 or u not in rest:
+            continue
+        x, y = left_parabolic(s,u,rest)
+        if len(x) == m-1 and x[0] == u:
+            return tuple(z), u, x, y
+    return None
+
+
+""" Laurent polynomials in v, as dictionaries """
+
+def l_add(a,b,c=1):
+    """
+    Add c * b to the Laurent polynomial a in place, where c is an integer or
+    a Laurent polynomial.
+    """
+    if not isinstance(c,dict):
+        c = {0: c}
+    for i in b:
+        for j in c:
+            a[i+j] = a.get(i+j,0) + b[i] * c[j]
+            if a[i+j] == 0:
+                del a[i+j]
+    return a
+
+def v_add(d,e,c=1):
+    """
+    Add c * e to the vector d (a dictionary of Laurent polynomials) in place.
+    """
+    for w in e:
+        p = l_add(d.get(w,{}),e[w],c)
+        if p:
+            d[w] = p
+        elif w in d:
+            del d[w]
+    return d
+
+def to_expression(a):
+    """
+    Return the Laurent polynomial a as an expression in v.
+
+    EXAMPLE:
+        sage: to_expression({-1:1, 1:1})
+        sage: v + 1/v
+    """
+    return sum(a[i] * v**i for i in a)
+
+
+""" the action of T_s and c_s on the t-basis """
+
+t_actions = {}
+
+def t_action(s,t,cartan='A'):
+    """
+    Return T_s * t_w for the fully-commutative element w with canonical word
+    t, as a vector in the t-basis.
+
+    EXAMPLE:
+        sage: t_action(1,(1,),'A')
+        sage: {(1,): {-1: 1, 1: -1}, (): {0: 1}}
+
+        sage: t_action(1,(2,1),'A')
+        sage: {(1,2): {1: -1}, (2,1): {1: -1}, (1,): {2: -1}, (2,): {2: -1},
+               (): {3: -1}}
+    """
+    key = (cartan,s,t)
+    if key in t_actions:
+        return t_actions[key]
+    if s in descents(t)[0]:
+        d = {t: {-1: 1, 1: -1},
+             heap_canonical_tuple(remove_first(s,t)): {0: 1}}
+    else:
+        b = braid(s,t,cartan)
+        if b is None:
+            d = {heap_canonical_tuple((s,) + t): {0: 1}}
+        else:
+            # T_z T_{sx} T_y, with T_{sx} = - sum of v^{m-l(c)} T_c, c < sx
+            z, u, x, y = b
+            m = len(x) + 1
+            e = {}
+            ty = {heap_canonical_tuple(y): {0: 1}}
+            for k in range(m):
+                for first in (s,u):
+                    c = tuple((first,(s+u)-first)[i % 2] for i in range(k))
+                    if k == 0 and first == u:
+                        continue
+                    v_add(e,t_word_action(c,ty,cartan),{m-k: -1})
+            d = t_word_action(z,e,cartan)
+    t_actions[key] = d
+    return d
+
+def t_word_action(z,d,cartan='A'):
+    """
+    Return T_z * d for a word z and a vector d in the t-basis.
+    """
+    for s in reversed(z):
+        e = {}
+        for w in d:
+            v_add(e,t_action(s,w,cartan),d[w])
+        d = e
+    return d
+
+def c_action(s,d,cartan='A'):
+    """
+    Return c_s * d = (T_s + v) * d for a vector d in the t-basis.
+    """
+    e = {}
+    for w in d:
+        v_add(e,t_action(s,w,cartan),d[w])
+    return v_add(e,d,{1: 1})
+
+
+""" the canonical basis """
+
+kl_bases = {}
+
+def kl_basis(t,cartan='A'):
+    """
+    Return c_w in the t-basis, for the fully-commutative element w with
+    canonical word t.
+
+    NOTE:
+    As for Kazhdan-Lusztig polynomials, c_s * c_{sw} is c_w plus a bar
+    invariant combination of shorter c_z, and c_w is the only element of the
+    form t_w + (combination of shorter t_z with coefficients in vZ[v]). The
+    terms of c_s * c_{sw} without positive powers of v are removed from the
+    top down.
+
+    EXAMPLE:
+        sage: kl_basis((1,2,1),'B')
+        sage: {(1,2,1): {0: 1}, (2,1): {1: 1}, (1,2): {1: 1}, (1,): {2: 1},
+               (2,): {2: 1}, (): {3: 1}}
+    """
+    key = (cartan,t)
+    if key in kl_bases:
+        return kl_bases[key]
+    if t == ():
+        d = {(): {0: 1}}
+    else:
+        s = t[0]
+        d = c_action(s,kl_basis(heap_canonical_tuple(t[1:]),cartan),cartan)
+        for z in sorted(d,key=len,reverse=True):
+            if z == t or z not in d:
+                continue
+            low = dict((i,c) for (i,c) in d[z].items() if i <= 0)
+            if low:
+                bar = dict(low)
+                for i in low:
+                    if i < 0:
+                        bar[-i] = bar.get(-i,0) + low[i]
+                v_add(d,kl_basis(z,cartan),dict((i,-c) for (i,c) in bar.items()))
+    kl_bases[key] = d
+    return d
+
+def to_kl(d,cartan='A'):
+    """
+    Write a vector d in the t-basis in the canonical basis: the longest t_z in
+    d only occurs in c_z.
+    """
+    d = dict((w,dict(d[w])) for w in d)
+    e = {}
+    while d:
+        z = max(d,key=len)
+        e[z] = dict(d[z])
+        v_add(d,kl_basis(z,cartan),dict((i,-c) for (i,c) in d[z].items()))
+    return e
+
+def result(e):
+    """
+    Return a vector in the canonical basis with canonical Words as keys and
+    expressions in v as values.
+    """
+    return dict((Word(z),to_expression(e[z])) for z in e)
+
+
+""" multiplication of c_s * c_w, c_w * c_s and c_x * c_y """
+
+products = {}
+
+def s_times_w_ab(s,w,cartan='A'):
+    """
+    Return c_s * c_w as a linear combination of KL basis elements of
+    fully-commutative elements, the other terms being dropped.
+
+    EXAMPLES:
+        sage: s_times_w_ab(1,21,'A')
+        sage: {1: 1}
+
+        sage: s_times_w_ab(1,21,'B')
+        sage: {121: 1, 1: 1}
+
+        sage: s_times_w_ab(2,121,'B')
+        sage: {21: 1}
+    """
+    t = heap_canonical_tuple(to_tuple(w))
+    key = (cartan,s,t)
+    if key not in products:
+        if s in descents(t)[0]:
+            e = {t: {-1: 1, 1: 1}}
+        else:
+            e = to_kl(c_action(s,kl_basis(t,cartan),cartan),cartan)
+        products[key] = e
+    return result(products[key])
+
+def w_times_s_ab(w,s,cartan='A'):
+    """
+    Return c_w * c_s as a linear combination of KL basis elements, from
+    c_s * c_{w^{-1}}: the anti-involution T_w -> T_{w^{-1}} fixes the c_w and
+    the ideal J.
+
+    EXAMPLE:
+        sage: w_times_s_ab(12,1,'B')
+        sage: {121: 1, 1: 1}
+    """
+    t = to_tuple(w)
+    d = s_times_w_ab(s,t[::-1],cartan)
+    return dict((Word(heap_canonical_tuple(z.letters()[::-1])),d[z])
+                for z in d)
+
+def x_times_y_ab(x,y,cartan='A'):
+    """
+    Return c_x * c_y as a linear combination of KL basis elements.
+
+    EXAMPLE:
+        sage: x_times_y_ab(12,21,'B')
+        sage: {1: v + 1/v, 121: v + 1/v}
+    """
+    cx = kl_basis(heap_canonical_tuple(to_tuple(x)),cartan)
+    cy = kl_basis(heap_canonical_tuple(to_tuple(y)),cartan)
+    d = {}
+    for z in cx:
+        v_add(d,t_word_action(z,cy,cartan),cx[z])
+    return result(to_kl(d,cartan))
+
+
+""" cells """
+
+def left_targets_ab(t,n,cartan='A'):
+    """
+    Return the canonical words of the z != w with c_z in some c_s * c_w, for
+    the fully-commutative element w of A_n or B_n with canonical word t.
+
+    EXAMPLE:
+        sage: sorted(left_targets_ab((2,1),3,'B'))
+        sage: [(1,), (1,2,1), (3,2,1)]
+    """
+    targets = set()
+    for s in range(1,n+1):
+        if s in descents(t)[0]:
+            continue
+        for z in s_times_w_ab(s,t,cartan):
+            targets.add(z.letters())
+    return targets
+
+def left_graph_ab(elements,n,cartan='A'):
+    """
+    Return the graph on elements given by left multiplication, as arrays
+    (starts, targets) as in fc.py's cell_graph: the targets of elements[i]
+    are the indices of the z in left_targets_ab.
+    """
+    index = dict((elements[i],i) for i in range(len(elements)))
+    starts = [0]
+    targets = []
+    for t in elements:
+        targets += sorted(index[z] for z in left_targets_ab(t,n,cartan))
+        starts.append(len(targets))
+    return starts, targets
+
+def left_cells_ab(n,cartan='A'):
+    """
+    Return the left cells of A_n or B_n that consist of fully-commutative
+    elements, as sorted lists of Words.
+
+    NOTE:
+    The c_w with w not fully-commutative span an ideal, so a left cell
+    containing a fully-commutative element consists of fully-commutative
+    elements, and paths between them never leave them.
+
+    EXAMPLE:
+        sage: left_cells_ab(2,'A')
+        sage: [[], [1, 21], [2, 12]]
+    """
+    elements = list(fc_elements(coxeter_matrix(n,cartan)))
+    cells = [sorted(Word(elements[i]) for i in c) for c in
+             strongly_connected_components(*left_graph_ab(elements,n,cartan))]
+    return sorted(cells)
+
+def left_cell_ab(w,n,cartan='A'):
+    """
+    Return the left cell of the fully-commutative element w in A_n or B_n.
+
+    NOTE:
+    Only the elements reached from w by left multiplication are visited; the
+    left cell of w consists of those from which w is reached back.
+
+    EXAMPLE:
+        sage: left_cell_ab(13,3,'A')
+        sage: [13, 213]
+    """
+    t = heap_canonical_tuple(to_tuple(w))
+    sources = {t: []}
+    queue = [t]
+    for x in queue:
+        for z in left_targets_ab(x,n,cartan):
+            if z not in sources:
+                sources[z] = []
+                queue.append(z)
+            sources[z].append(x)
+    cell = set([t])
+    queue = [t]
+    for z in queue:
+        for x in sources[z]:
+            if x not in cell:
+                cell.add(x)
+                queue.append(x)
+    return sorted(Word(x) for x in cell)
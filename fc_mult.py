@@ -1,10 +1,12 @@
 import itertools
 from collections import defaultdict
+from collections import deque
+from conversions import Word
 
 """ Tuple Operations """
 
 def convert_to_word(l):
-    return int(''.join(map(str,l)))
+    return Word(l)
 
 def remove_first(t,y):
     """ Remove the first occurrence of t from a tuple y.
@@ -200,8 +202,7 @@ def left_justify(y):
     l = []
     remain = y
     while remain != tuple():
-        x = onetwo_on_left(remain)[0]
-        y = onetwo_on_left(remain)[1]
+        x, y = onetwo_on_left(remain)
         ll = my_append(l,x)
         l = my_append(ll,before_12(y))
         remain = after_12(y) 
@@ -443,21 +444,21 @@ def factor_to_poly(l):
     return d
 
 def descendents_of(w,n):
-    new_vertices = [w]
-    current_vertices = [w]
+    seen = set([w])
+    frontier = deque([w])
     edges = defaultdict(list)
-    while new_vertices != []:
-        for w in new_vertices:
-            for s in range(1,n+1):
-                d = s_times_w(s,w)
-                for y in d:
-                    y_word = convert_to_word(y)
-                    if y != w and (y_word not in edges[convert_to_word(w)]):
-                        edges[convert_to_word(w)] += [convert_to_word(y)]
-                        if y not in current_vertices:
-                            new_vertices = new_vertices + [y]
-                            current_vertices = current_vertices + [y]
-            new_vertices.remove(w)  
+    while frontier:
+        w = frontier.popleft()
+        out = edges[convert_to_word(w)]
+        found = set()
+        for s in range(1,n+1):
+            for y in s_times_w(s,w):
+                if y != w and y not in found:
+                    found.add(y)
+                    out.append(convert_to_word(y))
+                    if y not in seen:
+                        seen.add(y)
+                        frontier.append(y)
     return edges
 
 def descendent_graph(w,n):
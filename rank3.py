@@ -60,16 +60,22 @@ def path(m12,m23):
 
 ### code for the Coxeter group with m12=4, m23=6, m13=2
 
+# A code lists the lengths of the (2,3)-segments between the 1's, as the
+# digits of an integer or, when some length is 10 or more, as a tuple.
+
 def code_to_word(s):
     if s==0:
         return (1,)
     else:
-        t = ((1,)+dihedral_string(2,3,int(l))+(1,) for l in tuple(str(s)))
+        lengths = s if isinstance(s,tuple) else tuple(int(l) for l in str(s))
+        t = ((1,)+dihedral_string(2,3,l)+(1,) for l in lengths)
         word = reduce(lambda x,y: x+y[1:], t)
         return word
 
 def path_prod(s,t,m12,m23):
-    word_dic = t_basis_product(code_to_word(s),code_to_word(t),path(m12,m23))
+    M = path(m12,m23)
+    x = JCElement({code_to_word(s):1},M) * JCElement({code_to_word(t):1},M)
+    word_dic = x.terms()
     l = [str(word_to_code(key))+'*'+str(word_dic[key]) for key in word_dic]
     return '+'.join(l)
 
@@ -81,6 +87,8 @@ def word_to_code(t):
         return 1
     else:
         codes = [len(x[2*i+1]) for i in range(len(x)//2)]
+        if max(codes) > 9:
+            return tuple(codes)
         n = int(''.join(map(str,codes)))
         return n 
 
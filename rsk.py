@@ -0,0 +1,311 @@
+import itertools
+from bisect import bisect_left
+from collections import defaultdict
+from conversions import Word
+
+""" Kazhdan-Lusztig cells of type A_n from the Robinson-Schensted
+correspondence, without the Hecke algebra.
+
+A word a_1 ... a_k in the generators 1, ..., n is the permutation
+s_{a_1} ... s_{a_k} of {1, ..., n+1}, written in one-line notation. Left
+multiplication by s_i exchanges the values i and i+1, which moves along dual
+Knuth classes, so the left cells are the fibres of the recording tableau Q,
+the right cells those of the insertion tableau P, and the 2-sided cells
+those of the common shape. """
+
+
+""" words and permutations """
+
+def word_to_permutation(w,n):
+    """
+    Return the permutation s_{a_1} ... s_{a_k} of {1, ..., n+1} for a word
+    w = a_1 ... a_k, in one-line notation.
+
+    EXAMPLE:
+        sage: word_to_permutation(21,2)
+        sage: (3, 1, 2)
+    """
+    p = list(range(1,n+2))
+    for s in (Word(w).letters() if w else ()):
+        p[s-1], p[s] = p[s], p[s-1]     # p * s_s exchanges positions
+    return tuple(p)
+
+def permutation_to_word(p):
+    """
+    Return the lexicographically smallest reduced word of a permutation in
+    one-line notation, as in KL_cells: the first letter is the smallest left
+    descent i, i.e., the smallest i with i+1 to the left of i.
+
+    EXAMPLE:
+        sage: permutation_to_word((3,1,2))
+        sage: 21
+    """
+    position = [0]*(len(p)+2)
+    for j in range(len(p)):
+        position[p[j]] = j
+    word = []
+    i = 1
+    while i < len(p):
+        if position[i] > position[i+1]:
+            word.append(i)
+            position[i], position[i+1] = position[i+1], position[i]
+            i = max(i-1,1)
+        else:
+            i = i+1
+    return Word(word)
+
+
+""" the Robinson-Schensted correspondence """
+
+def rs_tableaux(p):
+    """
+    Return the insertion and recording tableaux (P, Q) of a permutation in
+    one-line notation, as tuples of rows.
+
+    NOTE:
+    Each row is increasing, so the entry bumped from a row is found by
+    bisection.
+
+    EXAMPLE:
+        sage: rs_tableaux((3,1,2))
+        sage: (((1, 2), (3,)), ((1, 3), (2,)))
+    """
+    P = []
+    Q = []
+    for j in range(len(p)):
+        x = p[j]
+        r = 0
+        while True:
+            if r == len(P):
+                P.append([x])
+                Q.append([j+1])
+                break
+            row = P[r]
+            k = bisect_left(row,x)
+            if k == len(row):
+                row.append(x)
+                Q[r].append(j+1)
+                break
+            row[k], x = x, row[k]
+            r = r+1
+    return tuple(map(tuple,P)), tuple(map(tuple,Q))
+
+def shape(T):
+    """
+    Return the shape of a tableau.
+    """
+    return tuple(len(row) for row in T)
+
+
+""" cells """
+
+def classify(n,permutations=None):
+    """
+    Sort the elements of S_{n+1} into left, right and 2-sided cells of A_n.
+
+    INPUT:
+    -- 'permutations': an iterable of permutations in one-line notation to
+    classify instead of all of S_{n+1}; it is only read once, so it can be a
+    generator
+
+    OUTPUT:
+    -- a triple of dictionaries sending Q, P and the shape to the list of
+    the words of the elements with that recording tableau, insertion tableau
+    or shape
+
+    NOTE:
+    The dictionaries hold the word of every permutation three times, which
+    is about 40MB for all of S_9 (n = 8); kl_cells_lines writes the cells of
+    A_n while holding one cell at a time.
+
+    EXAMPLE:
+        sage: classify(2)[0]
+        sage: {((1,), (2,), (3,)): [121], ((1, 2), (3,)): [2, 12],
+               ((1, 3), (2,)): [1, 21], ((1, 2, 3),): []}
+    """
+    if permutations is None:
+        permutations = itertools.permutations(range(1,n+2))
+    left = defaultdict(list)
+    right = defaultdict(list)
+    two_sided = defaultdict(list)
+    for p in permutations:
+        P, Q = rs_tableaux(p)
+        w = permutation_to_word(p)
+        left[Q].append(w)
+        right[P].append(w)
+        two_sided[shape(P)].append(w)
+    return left, right, two_sided
+
+def sorted_cells(cells):
+    """
+    Return the cells in a dictionary from classify as sorted lists, in the
+    order of their smallest elements.
+    """
+    return sorted(sorted(c) for c in cells.values())
+
+def format_cells(cells):
+    """
+    Return the lines listing cells as in KL_cells, numbered from 0 with the
+    numbers right-aligned.
+
+    EXAMPLE:
+        sage: format_cells([[Word(())], [Word(1), Word(21)]])
+        sage: ['0 : {}', '1 : {1,21}']
+    """
+    width = len(str(len(cells)-1))
+    return [format_cell(i,width,cells[i]) for i in range(len(cells))]
+
+def format_cell(i,width,cell):
+    """
+    Return the line listing the i-th cell as in format_cells, with the
+    number right-aligned to width.
+    """
+    return str(i).rjust(width) + " : {" + ",".join(str(w) for w in cell) + "}"
+
+def kl_cells_text(n):
+    """
+    Return the text of KL_cells/A<n>: the Coxeter matrix of A_n, the left
+    cells and the 2-sided cells, each listed with the lexicographically
+    smallest reduced words of its elements.
+
+    EXAMPLE:
+        sage: kl_cells_text(3) == open('KL_cells/A3').read()
+        sage: True
+    """
+    return "".join(line + "\n" for line in kl_cells_lines(n))
+
+def kl_cells_lines(n):
+    """
+    Generate the lines of kl_cells_text(n), one cell at a time.
+
+    NOTE:
+    The left cells are keyed by their recording tableaux Q and generated by
+    left_cell_words. A first pass finds the smallest word of every left
+    cell, which gives the order of the listing, and only these words are
+    kept; a second pass generates each left cell again and writes it out.
+    A 2-sided cell is the union of the left cells of its shape, sorted, so
+    it is held in memory while its line is written: the largest one, of
+    (f^lambda)^2 words for the largest number f^lambda of standard tableaux
+    of a shape, bounds the memory. That is 46656 words for n = 8 but about
+    6 * 10^7 for n = 11, and the time grows like (n+1)!, so the listing is
+    practical up to n = 9 or so.
+    """
+    tableaux = [Q for sh in partitions(n+1) for Q in standard_tableaux(sh)]
+    left = sorted((min(left_cell_words(Q)),Q) for Q in tableaux)
+    firsts = {}
+    for (w,Q) in left:
+        firsts.setdefault(shape(Q),w)
+    two_sided = sorted((firsts[sh],sh) for sh in firsts)
+    yield "Coxeter Matrix:"
+    yield ""
+    for s in range(1,n+1):
+        yield "[" + " ".join(str(3 if abs(s-t) == 1 else 1 if s == t else 2)
+                             for t in range(1,n+1)) + "]"
+    for line in ["", "", "Left cells:", ""]:
+        yield line
+    width = len(str(len(left)-1))
+    for i in range(len(left)):
+        yield format_cell(i,width,sorted(left_cell_words(left[i][1])))
+    for line in ["", "", "2-sided cells:", ""]:
+        yield line
+    width = len(str(len(two_sided)-1))
+    for i in range(len(two_sided)):
+        sh = two_sided[i][1]
+        yield format_cell(i,width,sorted(w for Q in standard_tableaux(sh)
+                                         for w in left_cell_words(Q)))
+    yield ""
+
+def write_kl_cells(n,filename=None):
+    """
+    Write kl_cells_text(n) to filename, by default KL_cells/A<n>, line by
+    line as kl_cells_lines generates it.
+    """
+    if filename is None:
+        filename = 'KL_cells/A' + str(n)
+    with open(filename,'w') as f:
+        for line in kl_cells_lines(n):
+            f.write(line + "\n")
+
+def left_cell_of(w,n):
+    """
+    Return the left cell of w in A_n, the elements with the same recording
+    tableau, by running the inverse correspondence over the insertion
+    tableaux of that shape.
+
+    EXAMPLE:
+        sage: left_cell_of(13,3)
+        sage: [13, 213]
+    """
+    P, Q = rs_tableaux(word_to_permutation(w,n))
+    return sorted(left_cell_words(Q))
+
+def left_cell_words(Q):
+    """
+    Generate the words of the elements with recording tableau Q, one for
+    each insertion tableau of the shape of Q.
+    """
+    for T in standard_tableaux(shape(Q)):
+        yield permutation_to_word(inverse_rs(T,Q))
+
+def partitions(size):
+    """
+    Generate the partitions of size, as shapes in decreasing lexicographic
+    order.
+
+    EXAMPLE:
+        sage: list(partitions(3))
+        sage: [(3,), (2, 1), (1, 1, 1)]
+    """
+    def parts(rest,largest):
+        if rest == 0:
+            yield ()
+            return
+        for k in range(min(rest,largest),0,-1):
+            for p in parts(rest-k,k):
+                yield (k,) + p
+    return parts(size,size)
+
+def standard_tableaux(sh):
+    """
+    Generate the standard tableaux of a given shape, as tuples of rows.
+
+    EXAMPLE:
+        sage: list(standard_tableaux((2,1)))
+        sage: [((1, 2), (3,)), ((1, 3), (2,))]
+    """
+    size = sum(sh)
+    def fill(rows,k):
+        if k > size:
+            yield tuple(map(tuple,rows))
+            return
+        for r in range(len(sh)):
+            if len(rows[r]) < sh[r] and (r == 0 or len(rows[r-1]) > len(rows[r])):
+                rows[r].append(k)
+                for T in fill(rows,k+1):
+                    yield T
+                rows[r].pop()
+    return fill([[] for r in sh],1)
+
+def inverse_rs(P,Q):
+    """
+    Return the permutation with insertion tableau P and recording tableau Q.
+
+    EXAMPLE:
+        sage: inverse_rs(((1, 2), (3,)), ((1, 3), (2,)))
+        sage: (3, 1, 2)
+    """
+    P = [list(row) for row in P]
+    where = {}
+    for r in range(len(Q)):
+        for c in range(len(Q[r])):
+            where[Q[r][c]] = r
+    p = []
+    for j in range(len(where),0,-1):
+        r = where[j]
+        x = P[r].pop()
+        for rr in range(r-1,-1,-1):
+            row = P[rr]
+            k = bisect_left(row,x) - 1
+            row[k], x = x, row[k]
+        p.append(x)
+    return tuple(reversed(p))
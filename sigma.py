@@ -1,5 +1,6 @@
 # To be used only when hecke.py has been loaded.
 import hecke
+from conversions import Word, word_to_tuple
 
 # Computatzion of T_w0 * c_w.
 def ts_times_cw(type,s,w):
@@ -83,9 +84,9 @@ def tw0_times_cw(type,w):
 
 def compress_tuple(t):
     r"""
-    Compress a tuple of digits into a number, e.g., (2,3,1) --> 231
+    Compress a tuple of letters into a Word, e.g., (2,3,1) --> 231
     """
-    return int(''.join(map(str,t)))
+    return Word(t)
 
 def compress_key(d):
     r""" 
@@ -100,7 +101,7 @@ def compress_key(d):
 def inv(type,l,w):
     d = tw0_times_cw(type,w)
     for x in l:
-        if x in d:
+        if Word(x) in d:
             return x 
         else: 
             continue
@@ -112,12 +113,12 @@ def print_inv(type,d):
     for k in d:
         print 'Left cell #{}: {}'.format(i,d[k])
         for elt in d[k]:
-            print '{} --> {}'.format(elt,inv(type,d[k],tuple(int(i) for i in str(elt))))
+            print '{} --> {}'.format(elt,inv(type,d[k],word_to_tuple(elt)))
         print ''
         i = i+1
 
 def convert_expression_BDFH(rank,w):
-    return compress_tuple((rank+1-int(i) for i in str(w)))
+    return compress_tuple(rank+1-i for i in word_to_tuple(w))
 
 def convert_lcells_BDFH(rank,d):
     return {k:[convert_expression_BDFH(rank,w) for w in d[k]] for k in d}
@@ -167,7 +168,7 @@ def dihedral_tw0_times_cw(rank,w):
 def dihedral_inv(rank,l,w):
     d = dihedral_tw0_times_cw(rank,w)
     for x in l:
-        if x in d:
+        if Word(x) in d:
             return x
         else: 
             continue
@@ -180,8 +181,8 @@ def dihedral_print_inv(rank):
     for k in d:
         print 'Left cell #{}: {}'.format(i,d[k])
         for elt in d[k]:
-            print '{} --> {}'.format(elt,dihedral_inv(rank,d[k],tuple(int(i)
-                for i in str(elt)))) 
+            print '{} --> {}'.format(elt,dihedral_inv(rank,d[k],
+                word_to_tuple(elt))) 
         print ''
         i = i+1
 